@@ -1,8 +1,9 @@
 import logging
 from time import time
 from requests import get, RequestException, Response
-from psycopg2.extras import execute_values
 from .DataIngestor import DataIngestor
+from .BulkWriter import BulkWriter, INGESTION_CHANNEL
+from .ConnectionPool import ConnectionPool
 import datetime
 
 logging.basicConfig(level=logging.INFO)
@@ -10,8 +11,8 @@ logger = logging.getLogger(__name__)
 
 class AirQualityIngestor(DataIngestor):
     timestamp: int
-    def __init__(self, cities, timestamp: int = int(datetime.datetime.now(tz=datetime.UTC).timestamp() * 1000)):
-        super().__init__(cities)
+    def __init__(self, cities, timestamp: int = int(datetime.datetime.now(tz=datetime.UTC).timestamp() * 1000), concurrency: int | None = None, pool: ConnectionPool | None = None):
+        super().__init__(cities, concurrency, pool)
         self.timestamp = timestamp
 
     def fetch_data(self, lat, lon, city_name):
@@ -25,7 +26,7 @@ class AirQualityIngestor(DataIngestor):
                 "units": "metric"
             }
 
-            res: Response = get(url, params=params, timeout=60)
+            res: Response = self.session.get(url, params=params, timeout=60)
             res.raise_for_status()
             data = res.json()
 
@@ -97,53 +98,51 @@ class AirQualityIngestor(DataIngestor):
         if not (1 <= data["aqi"] <= 5):
             raise ValueError(f"AQI out of range: {data['aqi']}")
 
+        # Part of the natural key; flatten_data defaults a missing dt to 0, which would collide forever
+        if not data["timestamp"] > 0:
+            raise ValueError(f"Missing observation time for {data['city_name']}: {data['timestamp']}")
+
         return data
 
-    def save(self, air_quality_data):
-        """Save air quality data to DB; accepts a dict or list of dicts"""
-        try:
-            if isinstance(air_quality_data, dict):
-                air_quality_data = [air_quality_data]
-
-            cur = self.conn.cursor()
-            query = """
-            INSERT INTO air_quality_ingestion_data (
-                lat, long, aqi, co, no, no2, o3, so2, pm2_5, pm10, nh3,
-                city_name, ingestion_timestamp, data_source
-            ) VALUES %s
-            """
-
-            values = [
-                (
-                    d["lat"], d["lon"], d["aqi"],
-                    d["co"], d["no"], d["no2"], d["o3"], d["so2"],
-                    d["pm2_5"], d["pm10"], d["nh3"],
-                    d["city_name"],
-                    d["ingestion_timestamp"],
-                    d["data_source"]
-                )
-                for d in air_quality_data
-            ]
-
-            execute_values(cur, query, values)
-            self.conn.commit()
-            logger.info(f"[Ingestion]: Saved {len(air_quality_data)} records to database")
-        except Exception as err:
-            logger.error(f"[Ingestion]: Error saving data to database: {err}")
-            self.conn.rollback()
+    def save(self, air_quality_data) -> tuple[list[tuple[int, str]], list[int]]:
+        """Save air quality data to DB in one transaction; accepts a dict or list of dicts, returns rejected rows and skipped duplicates"""
+        if isinstance(air_quality_data, dict):
+            air_quality_data = [air_quality_data]
+
+        writer = BulkWriter(self.conn, "air_quality_ingestion_data", [
+            "lat", "long", "aqi", "co", "no", "no2", "o3", "so2", "pm2_5", "pm10", "nh3",
+            "city_name", "ingestion_timestamp", "data_source", "observation_timestamp"
+        ], natural_key=["city_name", "observation_timestamp", "data_source"], rollup="air_quality")
+
+        for d in air_quality_data:
+            writer.add((
+                d["lat"], d["lon"], d["aqi"],
+                d["co"], d["no"], d["no2"], d["o3"], d["so2"],
+                d["pm2_5"], d["pm10"], d["nh3"],
+                d["city_name"],
+                d["ingestion_timestamp"],
+                d["data_source"],
+                d["timestamp"]
+            ))
+
+        writer.notify_on_commit(INGESTION_CHANNEL, {"source": "air_quality", "ingestion_timestamp": self.timestamp})
+        rejected = writer.flush()
+        return rejected, writer.duplicates
 
     def process_cities(self):
         """Fetch, flatten, validate, and save air quality data for all cities"""
         logger.info("SWAB Air Quality Data Ingestion Starting...")
         results = []
+        validated = []
 
-        for i, city in enumerate(self.cities, 1):
+        for i, (city, raw_data, error) in enumerate(self.fetch_all(), 1):
             logger.info(f"Processing city {i}/{len(self.cities)}: {city['name']}")
             try:
-                raw_data = self.fetch_data(city["lat"], city["lon"], city["name"])
+                if error:
+                    raise error
                 flat = self.flatten_data(raw_data)
                 flat = self.validate_data(flat)
-                self.save(flat)
+                validated.append(flat)
 
                 results.append({
                     "city": city["name"],
@@ -155,6 +154,16 @@ class AirQualityIngestor(DataIngestor):
                 logger.error(f"Failed to process {city['name']}: {e}")
                 results.append({"city": city["name"], "status": "error", "error": str(e)})
 
+        # Write the whole run in one transaction; rejected rows mark their city as failed
+        saved = [r for r in results if r["status"] == "success"]
+        rejected, duplicates = self.save(validated)
+        for i, err in rejected:
+            saved[i]["status"] = "error"
+            saved[i]["error"] = err
+        # Already stored by an earlier run in the same API update window
+        for i in duplicates:
+            saved[i]["status"] = "duplicate"
+
         success_count = sum(1 for r in results if r["status"] == "success")
         logger.info(f"INGESTION SUMMARY: {success_count}/{len(self.cities)} cities successful")
         return results
\ No newline at end of file
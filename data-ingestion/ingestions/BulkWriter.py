@@ -0,0 +1,170 @@
+import io
+import json
+import logging
+import psycopg2
+from .Rollups import rollup_sql
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# COPY text format escapes; None is written as \N (NULL)
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+# NOTIFY channel the processing service listens on for freshly ingested rows
+INGESTION_CHANNEL = "ingestion_saved"
+
+class BulkWriter:
+    """Collects rows for one table and writes them in a single transaction with COPY FROM STDIN"""
+    table: str
+    columns: list[str]
+    natural_key: list[str] | None
+    rollup: str | None
+    rows: list[tuple]
+    rejected: list[tuple[int, str]]
+    duplicates: list[int]
+    notifications: list[tuple[str, dict]]
+
+    def __init__(self, conn: psycopg2.extensions.connection, table: str, columns: list[str], natural_key: list[str] | None = None, rollup: str | None = None):
+        self.conn = conn
+        self.table = table
+        self.columns = columns
+        # Columns identifying an observation; rows whose key is already stored are skipped instead of stored twice
+        self.natural_key = natural_key
+        # Source name in observation_rollups; stored rows are added to its rollups in the same transaction
+        self.rollup = rollup
+        self.rows = []
+        self.rejected = []
+        self.duplicates = []
+        self.notifications = []
+
+    def add(self, row: tuple) -> "BulkWriter":
+        self.rows.append(row)
+        return self
+
+    def notify_on_commit(self, channel: str, payload: dict) -> "BulkWriter":
+        """Send a NOTIFY in the same transaction, so listeners only hear about rows that were actually committed"""
+        self.notifications.append((channel, payload))
+        return self
+
+    def flush(self) -> list[tuple[int, str]]:
+        """Write all buffered rows and commit once; returns the (row index, error) pairs that were rejected"""
+        if not self.rows:
+            return self.rejected
+
+        cur = self.conn.cursor()
+        try:
+            cur.execute("SAVEPOINT bulk_copy")
+            try:
+                if self.natural_key or self.rollup:
+                    self._copy_staged(cur)
+                else:
+                    cur.copy_expert(self._copy_sql(self.table), self._to_copy_buffer(self.rows))
+            except psycopg2.Error as err:
+                # COPY is all-or-nothing, so isolate the bad rows instead of losing the batch
+                logger.warning(f"[Ingestion]: COPY into {self.table} failed, retrying row by row: {err}")
+                cur.execute("ROLLBACK TO SAVEPOINT bulk_copy")
+                self.duplicates = []
+                self._insert_row_by_row(cur)
+            stored = len(self.rows) - len(self.rejected) - len(self.duplicates)
+            if stored > 0:
+                for channel, payload in self.notifications:
+                    cur.execute("SELECT pg_notify(%s, %s)", (channel, json.dumps(payload)))
+            self.conn.commit()
+            logger.info(f"[Ingestion]: Saved {stored} records to {self.table} in one transaction, skipped {len(self.duplicates)} duplicates")
+        except Exception as err:
+            logger.error(f"[Ingestion]: Error saving data to database: {err}")
+            self.conn.rollback()
+            self.rejected = [(i, str(err)) for i in range(len(self.rows))]
+            self.duplicates = []
+        finally:
+            cur.close()
+            self.rows = []
+
+        return self.rejected
+
+    def _copy_sql(self, table: str) -> str:
+        return f"COPY {table} ({', '.join(self.columns)}) FROM STDIN"
+
+    def _copy_staged(self, cur):
+        """COPY into a session-local staging table, then move the rows into the real table in one statement.
+
+        With a natural key only rows with unseen keys are moved; with a rollup the moved rows are also
+        added to observation_rollups by the same statement.
+        """
+        staging = self._stage(cur, self.rows)
+        columns = ", ".join(self.columns)
+        insert = f"INSERT INTO {self.table} ({columns}) SELECT {columns} FROM {staging} s"
+        if self.natural_key:
+            key = ", ".join(self.natural_key)
+            self._lock_natural_key(cur)
+            insert = f"""
+                INSERT INTO {self.table} ({columns})
+                SELECT DISTINCT ON ({key}) {columns} FROM {staging} s
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {self.table} t
+                    WHERE {" AND ".join(f"t.{column} = s.{column}" for column in self.natural_key)}
+                )
+            """
+        rolled_up = f", rolled_up AS ({rollup_sql(self.rollup, 'inserted')})" if self.rollup else ""
+        cur.execute(f"""
+            WITH inserted AS ({insert} RETURNING *){rolled_up}
+            SELECT {key if self.natural_key else "NULL"} FROM inserted
+        """)
+        if self.natural_key:
+            self._mark_duplicates(set(cur.fetchall()))
+
+    def _stage(self, cur, rows: list[tuple]) -> str:
+        staging = f"{self.table}_staging"
+        cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE {self.table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+        cur.copy_expert(self._copy_sql(staging), self._to_copy_buffer(rows))
+        return staging
+
+    def _mark_duplicates(self, inserted: set[tuple]):
+        # The first row with an inserted key was stored; every other row was a duplicate
+        positions = [self.columns.index(column) for column in self.natural_key]
+        stored = set()
+        for i, row in enumerate(self.rows):
+            row_key = tuple(row[p] for p in positions)
+            if row_key in inserted and row_key not in stored:
+                stored.add(row_key)
+            else:
+                self.duplicates.append(i)
+
+    def _lock_natural_key(self, cur):
+        # The raw tables are partitioned, so no unique index can enforce the natural key; serialise writers instead
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('natural_key'), hashtext(%s))", (self.table,))
+
+    def _to_copy_buffer(self, rows: list[tuple]) -> io.StringIO:
+        buf = io.StringIO()
+        for row in rows:
+            buf.write("\t".join("\\N" if v is None else str(v).translate(COPY_ESCAPES) for v in row))
+            buf.write("\n")
+        buf.seek(0)
+        return buf
+
+    def _insert_row_by_row(self, cur):
+        query = f"INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES ({', '.join(['%s'] * len(self.columns))})"
+        if self.natural_key:
+            self._lock_natural_key(cur)
+            exists = f"SELECT 1 FROM {self.table} WHERE {' AND '.join(f'{column} = %s' for column in self.natural_key)}"
+            positions = [self.columns.index(column) for column in self.natural_key]
+        for i, row in enumerate(self.rows):
+            if self.natural_key:
+                cur.execute(exists, [row[p] for p in positions])
+                if cur.fetchone():
+                    self.duplicates.append(i)
+                    continue
+            cur.execute("SAVEPOINT bulk_row")
+            try:
+                cur.execute(query, row)
+                cur.execute("RELEASE SAVEPOINT bulk_row")
+            except psycopg2.Error as err:
+                cur.execute("ROLLBACK TO SAVEPOINT bulk_row")
+                logger.error(f"[Ingestion]: Rejected row {i} for {self.table}: {err}")
+                self.rejected.append((i, str(err).strip()))
+
+        if self.rollup:
+            # Every row left over was inserted and passed the table's constraints, so staging it cannot fail
+            skipped = set(self.duplicates) | {i for i, _ in self.rejected}
+            stored = [row for i, row in enumerate(self.rows) if i not in skipped]
+            if stored:
+                cur.execute(rollup_sql(self.rollup, self._stage(cur, stored)))
@@ -1,21 +1,68 @@
 import os
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from time import time
-from requests import get, RequestException, Response
+from requests import get, RequestException, Response, Session
+from requests.adapters import HTTPAdapter
 import psycopg2
 from abc import ABC, abstractmethod
+from .ConnectionPool import ConnectionPool, get_pool
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Max number of cities fetched in parallel; also the size of the keep-alive pool
+DEFAULT_CONCURRENCY = int(os.getenv("INGESTION_CONCURRENCY", "8"))
+
 class DataIngestor(ABC):
     cities: list[dict]
     api_key: str
-    def __init__(self, cities: list[dict]):
+    concurrency: int
+    session: Session
+    pool: ConnectionPool
+    conn: psycopg2.extensions.connection | None
+    def __init__(self, cities: list[dict], concurrency: int | None = None, pool: ConnectionPool | None = None):
         self.cities = cities
         self.api_key = os.getenv("WEATHER_API_KEY")
-        self.conn = psycopg2.connect(os.getenv("DATABASE_URL"))
+        self.pool = pool or get_pool()
+        self.conn = self.pool.getconn()
+        self.concurrency = max(1, concurrency or DEFAULT_CONCURRENCY)
+
+        # One shared session so every worker reuses pooled keep-alive connections
+        self.session = Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        """Return the database connection to the pool and drop idle HTTP connections"""
+        if self.conn is not None:
+            self.pool.putconn(self.conn)
+            self.conn = None
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fetch_all(self) -> list[tuple[dict, dict | None, Exception | None]]:
+        """Fetch raw data for all cities concurrently; returns (city, data, error) in city order"""
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [
+                executor.submit(self.fetch_data, city["lat"], city["lon"], city["name"])
+                for city in self.cities
+            ]
+
+        results = []
+        for city, future in zip(self.cities, futures):
+            try:
+                results.append((city, future.result(), None))
+            except Exception as err:
+                results.append((city, None, err))
+        return results
 
     @abstractmethod
     def fetch_data(self):
@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from time import time
+from typing import Callable
+from psycopg2.extras import Json, RealDictCursor
+from .ConnectionPool import ConnectionPool, get_pool
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Jobs run at the same time per service
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Seconds an idle worker waits before looking for new jobs again
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+# Running jobs refresh their heartbeat this often; one silent for JOB_LEASE_SECONDS is assumed lost with
+# its worker and handed to the next free one
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+def now_ms() -> int:
+    return int(time() * 1000)
+
+class JobContext:
+    """Handed to job handlers to report progress; only holds the id, so it can be pickled into worker processes"""
+    job_id: str
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+
+    @contextmanager
+    def stage(self, name: str):
+        """Mark name as the current stage and add its wall-clock time to the job's stage timings"""
+        self._update("UPDATE pipeline_jobs SET current_stage = %s WHERE id = %s;", (name, self.job_id))
+        start = time()
+        try:
+            yield
+        finally:
+            self._update("""
+                UPDATE pipeline_jobs
+                SET stages = jsonb_set(stages, ARRAY[%s], to_jsonb(COALESCE((stages->>%s)::float, 0) + %s))
+                WHERE id = %s;
+            """, (name, name, round(time() - start, 4), self.job_id))
+
+    def _update(self, query: str, params: tuple):
+        with get_pool().connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            cursor.close()
+
+
+class JobQueue:
+    """Postgres-backed job queue: identical pending jobs are de-duplicated and run by a bounded set of worker threads"""
+    handlers: dict[str, Callable]
+
+    def __init__(self, handlers: dict[str, Callable], pool: ConnectionPool | None = None, workers: int = JOB_WORKERS):
+        self.handlers = handlers
+        self.pool = pool or get_pool()
+        self.workers = workers
+        self._threads: list[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+
+    def enqueue(self, kind: str, params: dict | None = None) -> str:
+        """Queue a job and return its id; an identical job that is still pending is reused instead.
+
+        A running job is never reused: it may have fetched its input before the data this call is about landed.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO pipeline_jobs (kind, params, created_at)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (kind, params) WHERE status = 'pending' DO NOTHING
+                RETURNING id;
+            """, (kind, Json(params), now_ms()))
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute("""
+                    SELECT id FROM pipeline_jobs
+                    WHERE kind = %s AND params = %s AND status = 'pending';
+                """, (kind, Json(params)))
+                row = cursor.fetchone()
+            cursor.close()
+
+        if row is None:
+            # The duplicate was claimed between the two statements; queue a fresh one
+            return self.enqueue(kind, params)
+        self._wakeup.set()
+        return str(row[0])
+
+    def get(self, job_id: str) -> dict | None:
+        try:
+            uuid.UUID(job_id)
+        except ValueError:
+            return None
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute("SELECT * FROM pipeline_jobs WHERE id = %s;", (job_id,))
+            job = cursor.fetchone()
+            cursor.close()
+        if job is None:
+            return None
+        job["id"] = str(job["id"])
+        end = job["finished_at"] or now_ms()
+        job["elapsed_seconds"] = (end - job["started_at"]) / 1000 if job["started_at"] else None
+        return dict(job)
+
+    def start(self):
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                job = self._claim()
+            except Exception as err:
+                logger.error(f"[Jobs]: Could not claim a job: {err}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(JOB_POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self._run(*job)
+
+    def _claim(self) -> tuple[str, str, dict] | None:
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            # Jobs whose worker died mid-run (crash, redeploy) go back to the queue once their lease expires,
+            # unless an identical job is already pending; only one copy may wait, see enqueue()
+            cursor.execute("""
+                WITH expired AS (
+                    SELECT id, copy = 1 AND NOT EXISTS (
+                        SELECT 1 FROM pipeline_jobs p
+                        WHERE p.status = 'pending' AND p.kind = e.kind AND p.params = e.params
+                    ) AS requeue
+                    FROM (
+                        SELECT id, kind, params, row_number() OVER (PARTITION BY kind, params ORDER BY created_at) AS copy
+                        FROM pipeline_jobs
+                        WHERE status = 'running' AND kind = ANY(%s) AND COALESCE(heartbeat_at, started_at) < %s
+                    ) e
+                )
+                UPDATE pipeline_jobs j
+                SET status = CASE WHEN e.requeue THEN 'pending' ELSE 'failed' END,
+                    error = CASE WHEN e.requeue THEN NULL ELSE 'Lease expired; an identical job is already queued' END,
+                    started_at = CASE WHEN e.requeue THEN NULL ELSE j.started_at END,
+                    finished_at = CASE WHEN e.requeue THEN NULL ELSE %s END,
+                    heartbeat_at = NULL, current_stage = NULL
+                FROM expired e
+                WHERE j.id = e.id
+                RETURNING e.requeue;
+            """, (list(self.handlers), now_ms() - int(JOB_LEASE_SECONDS * 1000), now_ms()))
+            requeued = sum(1 for (requeue,) in cursor.fetchall() if requeue)
+            if cursor.rowcount:
+                logger.warning(f"[Jobs]: {cursor.rowcount} job(s) lost their lease, {requeued} requeued")
+
+            # SKIP LOCKED lets several workers and service replicas share the table safely
+            cursor.execute("""
+                UPDATE pipeline_jobs SET status = 'running', started_at = %s, heartbeat_at = %s
+                WHERE id = (
+                    SELECT id FROM pipeline_jobs
+                    WHERE status = 'pending' AND kind = ANY(%s)
+                    ORDER BY created_at
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id, kind, params;
+            """, (now_ms(), now_ms(), list(self.handlers)))
+            row = cursor.fetchone()
+            cursor.close()
+        return (str(row[0]), row[1], row[2]) if row else None
+
+    def _run(self, job_id: str, kind: str, params: dict):
+        logger.info(f"[Jobs]: Running {kind} job {job_id} with {params}")
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, done), name=f"job-heartbeat-{job_id}", daemon=True)
+        heartbeat.start()
+        try:
+            result = self.handlers[kind](JobContext(job_id), **params)
+            status, error = "succeeded", None
+        except Exception as err:
+            logger.error(f"[Jobs]: {kind} job {job_id} failed: {err}")
+            result, status, error = None, "failed", str(err)
+        finally:
+            done.set()
+            heartbeat.join()
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE pipeline_jobs
+                SET status = %s, result = %s, error = %s, current_stage = NULL, finished_at = %s
+                WHERE id = %s;
+            """, (status, Json(result, dumps=lambda o: json.dumps(o, default=str)), error, now_ms(), job_id))
+            cursor.close()
+
+    def _heartbeat(self, job_id: str, done: threading.Event):
+        while not done.wait(JOB_HEARTBEAT_INTERVAL):
+            try:
+                with self.pool.connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("UPDATE pipeline_jobs SET heartbeat_at = %s WHERE id = %s;", (now_ms(), job_id))
+                    cursor.close()
+            except Exception as err:
+                logger.error(f"[Jobs]: Could not renew the lease of job {job_id}: {err}")
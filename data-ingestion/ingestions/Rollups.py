@@ -0,0 +1,109 @@
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+# Bucket widths in milliseconds; buckets start on whole UTC hours and days
+ROLLUP_GRANULARITIES = {"hour": 3_600_000, "day": 86_400_000}
+
+# Raw table and rolled-up metrics per source; see migrations/006_observation_rollups.sql
+ROLLUP_SOURCES = {
+    "weather": "weather_ingestion_data",
+    "air_quality": "air_quality_ingestion_data",
+}
+ROLLUP_METRICS = {
+    "weather": [
+        "temp", "feels_like", "temp_min", "temp_max", "pressure", "humidity",
+        "sea_level", "grnd_level", "visibility", "wind_speed", "wind_deg", "clouds",
+    ],
+    "air_quality": ["aqi", "co", "no", "no2", "o3", "so2", "pm2_5", "pm10", "nh3"],
+}
+
+def rollup_sql(source: str, relation: str, granularities: list[str] | None = None) -> str:
+    """Upsert that adds every row of relation (raw-table shaped) to observation_rollups.
+
+    Also usable as a data-modifying CTE. Rows are bucketed on the API's observation time, or the
+    ingestion time for rows stored before observation_timestamp existed. granularities defaults to all.
+    """
+    metrics = ", ".join(f"('{metric}', o.{metric}::float8)" for metric in ROLLUP_METRICS[source])
+    granularities = ", ".join(
+        f"('{name}', {ROLLUP_GRANULARITIES[name]}::bigint)" for name in (granularities or ROLLUP_GRANULARITIES)
+    )
+    return f"""
+        INSERT INTO observation_rollups AS r (source, metric, granularity, city_name, bucket, count, sum, min, max, sum_sq)
+        SELECT '{source}', m.metric, g.granularity, o.city_name, o.observed - mod(o.observed, g.width),
+               COUNT(*), SUM(m.value), MIN(m.value), MAX(m.value), SUM(m.value * m.value)
+        FROM (SELECT *, COALESCE(observation_timestamp * 1000, ingestion_timestamp) AS observed FROM {relation}) o
+        CROSS JOIN (VALUES {granularities}) AS g (granularity, width)
+        CROSS JOIN LATERAL (VALUES {metrics}) AS m (metric, value)
+        GROUP BY m.metric, g.granularity, o.city_name, o.observed - mod(o.observed, g.width)
+        ON CONFLICT (source, metric, granularity, city_name, bucket) DO UPDATE SET
+            count = r.count + EXCLUDED.count,
+            sum = r.sum + EXCLUDED.sum,
+            min = LEAST(r.min, EXCLUDED.min),
+            max = GREATEST(r.max, EXCLUDED.max),
+            sum_sq = r.sum_sq + EXCLUDED.sum_sq
+    """
+
+def rebuild_rollups(cursor, source: str, removed: str):
+    """Recompute the buckets that rows were deleted from, using the raw rows still attached.
+
+    removed is a relation with the city_name and observed time (epoch ms) of every deleted row. Only
+    those (city, granularity, bucket) keys are touched, so buckets of months already detached by
+    retention keep their rollups.
+    """
+    table = ROLLUP_SOURCES[source]
+    observed = "COALESCE(t.observation_timestamp * 1000, t.ingestion_timestamp)"
+    for granularity, width in ROLLUP_GRANULARITIES.items():
+        keys = f"SELECT DISTINCT city_name, observed - mod(observed, {width}) AS bucket FROM {removed}"
+        cursor.execute(f"""
+            DELETE FROM observation_rollups r USING ({keys}) k
+            WHERE r.source = %s AND r.granularity = %s AND r.city_name = k.city_name AND r.bucket = k.bucket;
+        """, (source, granularity))
+        affected = f"""(
+            SELECT t.* FROM {table} t
+            WHERE (t.city_name, {observed} - mod({observed}, {width})) IN ({keys})
+        ) AS affected"""
+        cursor.execute(rollup_sql(source, affected, [granularity]))
+
+def query_rollups(conn: psycopg2.extensions.connection, source: str, metric: str, granularity: str = "day",
+                  from_ms: int | None = None, to_ms: int | None = None, city: str | None = None) -> dict:
+    """Per-bucket and whole-range count, mean, min, max and sample stddev of one metric.
+
+    Buckets starting in [from_ms, to_ms) are included. Only rollup rows are read, so the cost depends
+    on cities times buckets, never on how many raw rows were ingested.
+    """
+    if source not in ROLLUP_METRICS:
+        raise ValueError(f"Unknown source: {source}")
+    if metric not in ROLLUP_METRICS[source]:
+        raise ValueError(f"Unknown metric for {source}: {metric}")
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+
+    filters = "source = %s AND metric = %s AND granularity = %s AND bucket >= %s AND bucket < %s"
+    params = [source, metric, granularity, from_ms or 0, to_ms if to_ms is not None else 2 ** 62]
+    if city is not None:
+        filters += " AND city_name = %s"
+        params.append(city)
+
+    # Sample variance from the running sums: (sum_sq - sum^2 / n) / (n - 1)
+    stats = """
+        {count} AS count, {sum} / {count} AS mean, {min} AS min, {max} AS max,
+        CASE WHEN {count} > 1 THEN sqrt(GREATEST({sum_sq} - {sum} * {sum} / {count}, 0) / ({count} - 1)) END AS stddev
+    """
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute(f"""
+        SELECT city_name, bucket, {stats.format(count="count", sum="sum", min="min", max="max", sum_sq="sum_sq")}
+        FROM observation_rollups
+        WHERE {filters}
+        ORDER BY city_name, bucket;
+    """, params)
+    buckets = [dict(row) for row in cursor.fetchall()]
+    cursor.execute(f"""
+        SELECT city_name, {stats.format(count="SUM(count)::bigint", sum="SUM(sum)", min="MIN(min)", max="MAX(max)", sum_sq="SUM(sum_sq)")}
+        FROM observation_rollups
+        WHERE {filters}
+        GROUP BY city_name
+        ORDER BY city_name;
+    """, params)
+    totals = {row.pop("city_name"): dict(row) for row in cursor.fetchall()}
+    cursor.close()
+    return {"source": source, "metric": metric, "granularity": granularity, "buckets": buckets, "totals": totals}
@@ -0,0 +1,71 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+# Upper bounds for work pushed off the event loop
+THREAD_POOL_WORKERS = int(os.getenv("THREAD_POOL_WORKERS", "8"))
+PROCESS_POOL_WORKERS = int(os.getenv("PROCESS_POOL_WORKERS", str(os.cpu_count() or 2)))
+
+class TaskExecutor:
+    """Runs blocking I/O on a thread pool and CPU-bound work on a process pool so routes never block the event loop"""
+    threads: int
+    processes: int
+
+    def __init__(self, threads: int | None = None, processes: int | None = None):
+        self.threads = threads or THREAD_POOL_WORKERS
+        self.processes = processes or PROCESS_POOL_WORKERS
+        self._thread_pool: ThreadPoolExecutor | None = None
+        self._process_pool: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    async def run_in_thread(self, fn, *args, **kwargs):
+        """For blocking I/O: database calls, HTTP requests"""
+        return await self._submit(self._threads(), fn, *args, **kwargs)
+
+    async def run_in_process(self, fn, *args, **kwargs):
+        """For CPU-bound work; fn and its arguments must be picklable"""
+        return await self._submit(self._processes(), fn, *args, **kwargs)
+
+    def submit_to_process(self, fn, *args, **kwargs) -> Future:
+        """Process-pool submit for callers that are not on the event loop, e.g. job workers"""
+        return self._processes().submit(fn, *args, **kwargs)
+
+    def shutdown(self):
+        with self._lock:
+            if self._thread_pool is not None:
+                self._thread_pool.shutdown(wait=False, cancel_futures=True)
+                self._thread_pool = None
+            if self._process_pool is not None:
+                self._process_pool.shutdown(wait=False, cancel_futures=True)
+                self._process_pool = None
+
+    async def _submit(self, pool: Executor, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, partial(fn, *args, **kwargs))
+
+    def _threads(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="blocking")
+            return self._thread_pool
+
+    def _processes(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._process_pool is None:
+                # spawn, so workers never inherit the parent's open sockets or threads
+                self._process_pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"))
+            return self._process_pool
+
+
+_executor: TaskExecutor | None = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> TaskExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = TaskExecutor()
+        return _executor
@@ -4,8 +4,9 @@ import logging
 from time import time
 from requests import get, RequestException, Response
 import psycopg2
-from psycopg2.extras import execute_values
 from .DataIngestor import DataIngestor
+from .BulkWriter import BulkWriter, INGESTION_CHANNEL
+from .ConnectionPool import ConnectionPool
 import datetime
 
 logging.basicConfig(level=logging.INFO)
@@ -13,8 +14,8 @@ logger = logging.getLogger(__name__)
 
 class WeatherDataIngestor(DataIngestor):
     timestamp: int
-    def __init__(self, cities: list[dict], timestamp: int = int(datetime.datetime.now(tz=datetime.UTC).timestamp() * 1000)):
-        super().__init__(cities)
+    def __init__(self, cities: list[dict], timestamp: int = int(datetime.datetime.now(tz=datetime.UTC).timestamp() * 1000), concurrency: int | None = None, pool: ConnectionPool | None = None):
+        super().__init__(cities, concurrency, pool)
         self.timestamp = timestamp
     
     def fetch_data(self, lat, lon, city_name) -> dict:
@@ -28,7 +29,7 @@ class WeatherDataIngestor(DataIngestor):
                 "units": "metric"
             }
 
-            res: Response = get(url, params=params, timeout=60)
+            res: Response = self.session.get(url, params=params, timeout=60)
             res.raise_for_status()
             data = res.json()
 
@@ -76,6 +77,9 @@ class WeatherDataIngestor(DataIngestor):
         flat["sunrise"] = sys_data.get("sunrise", 0)
         flat["sunset"] = sys_data.get("sunset", 0)
 
+        # Observation time reported by the API; with city and source it identifies the observation
+        flat["observation_timestamp"] = data.get("dt")
+
         flat["city_name"] = data.get("name", "")
         flat["ingestion_timestamp"] = data.get("ingestion_timestamp")
         flat["data_source"] = data.get("data_source", "openweathermap")
@@ -93,7 +97,7 @@ class WeatherDataIngestor(DataIngestor):
             "clouds",
             "weather_main", "weather_description",
             "sunrise", "sunset",
-            "city_name", "ingestion_timestamp", "data_source"
+            "observation_timestamp", "city_name", "ingestion_timestamp", "data_source"
         ]
 
         for field in required_fields:
@@ -104,54 +108,50 @@ class WeatherDataIngestor(DataIngestor):
         if not (-50 <= data["temp"] <= 50):
             raise ValueError(f"Temperature out of range for {data['city_name']}: {data['temp']}")
 
+        # Part of the natural key, so a placeholder value would collide with every later row
+        if not data["observation_timestamp"] > 0:
+            raise ValueError(f"Missing observation time for {data['city_name']}: {data['observation_timestamp']}")
+
         return data
 
-    def save(self, weather_data):
-        """Save weather data to DB; accepts a dict or list of dicts"""
-        try:
-            if isinstance(weather_data, dict):
-                weather_data = [weather_data]
-
-            cur = self.conn.cursor()
-            query = """
-            INSERT INTO weather_ingestion_data (
-                lat, lon, temp, feels_like, temp_min, temp_max,
-                pressure, humidity, sea_level, grnd_level, visibility,
-                wind_speed, wind_deg, clouds, weather_main, weather_description,
-                sunrise, sunset, city_name, ingestion_timestamp, data_source
-            ) VALUES %s
-            """
-
-            values = [
-                (
-                    d["lat"], d["lon"], d["temp"], d["feels_like"], d["temp_min"], d["temp_max"],
-                    d["pressure"], d["humidity"], d["sea_level"], d["grnd_level"], d["visibility"],
-                    d["wind_speed"], d["wind_deg"], d["clouds"], d["weather_main"], d["weather_description"],
-                    d["sunrise"], d["sunset"], d["city_name"], d["ingestion_timestamp"], d["data_source"]
-                )
-                for d in weather_data
-            ]
-
-            # Use execute_values for bulk insert
-            execute_values(cur, query, values)
-            self.conn.commit()
-            logger.info(f"[Ingestion]: Saved {len(weather_data)} records to database")
-        except Exception as err:
-            logger.error(f"[Ingestion]: Error saving data to database: {err}")
-            self.conn.rollback()
+    def save(self, weather_data) -> tuple[list[tuple[int, str]], list[int]]:
+        """Save weather data to DB in one transaction; accepts a dict or list of dicts, returns rejected rows and skipped duplicates"""
+        if isinstance(weather_data, dict):
+            weather_data = [weather_data]
+
+        writer = BulkWriter(self.conn, "weather_ingestion_data", [
+            "lat", "lon", "temp", "feels_like", "temp_min", "temp_max",
+            "pressure", "humidity", "sea_level", "grnd_level", "visibility",
+            "wind_speed", "wind_deg", "clouds", "weather_main", "weather_description",
+            "sunrise", "sunset", "city_name", "ingestion_timestamp", "data_source", "observation_timestamp"
+        ], natural_key=["city_name", "observation_timestamp", "data_source"], rollup="weather")
+
+        for d in weather_data:
+            writer.add((
+                d["lat"], d["lon"], d["temp"], d["feels_like"], d["temp_min"], d["temp_max"],
+                d["pressure"], d["humidity"], d["sea_level"], d["grnd_level"], d["visibility"],
+                d["wind_speed"], d["wind_deg"], d["clouds"], d["weather_main"], d["weather_description"],
+                d["sunrise"], d["sunset"], d["city_name"], d["ingestion_timestamp"], d["data_source"], d["observation_timestamp"]
+            ))
+
+        writer.notify_on_commit(INGESTION_CHANNEL, {"source": "weather", "ingestion_timestamp": self.timestamp})
+        rejected = writer.flush()
+        return rejected, writer.duplicates
 
     def process_cities(self):
         """Fetch, flatten, validate, and save data for all cities"""
         logger.info("SWAB Weather Data Ingestion Starting...")
         results = []
+        validated = []
 
-        for i, city in enumerate(self.cities, 1):
+        for i, (city, raw_data, error) in enumerate(self.fetch_all(), 1):
             logger.info(f"Processing city {i}/{len(self.cities)}: {city['name']}")
             try:
-                raw_data = self.fetch_data(city["lat"], city["lon"], city["name"])
+                if error:
+                    raise error
                 flat = self.flatten_data(raw_data)
                 flat = self.validate_data(flat)
-                self.save(flat)
+                validated.append(flat)
 
                 results.append({
                     "city": city["name"],
@@ -165,6 +165,16 @@ class WeatherDataIngestor(DataIngestor):
                 logger.error(f"Failed to process {city['name']}: {e}")
                 results.append({"city": city["name"], "status": "error", "error": str(e)})
 
+        # Write the whole run in one transaction; rejected rows mark their city as failed
+        saved = [r for r in results if r["status"] == "success"]
+        rejected, duplicates = self.save(validated)
+        for i, err in rejected:
+            saved[i]["status"] = "error"
+            saved[i]["error"] = err
+        # Already stored by an earlier run in the same API update window
+        for i in duplicates:
+            saved[i]["status"] = "duplicate"
+
         # Summary
         success_count = sum(1 for r in results if r["status"] == "success")
         logger.info(f"INGESTION SUMMARY: {success_count}/{len(self.cities)} cities successful")
@@ -0,0 +1,84 @@
+import logging
+from .ConnectionPool import ConnectionPool, get_pool
+from .Rollups import ROLLUP_SOURCES, rebuild_rollups
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Columns that identify an observation on rows stored before observation_timestamp existed
+LEGACY_OBSERVATION_COLUMNS = {
+    "weather_ingestion_data": [
+        "lat", "lon", "temp", "feels_like", "temp_min", "temp_max",
+        "pressure", "humidity", "sea_level", "grnd_level", "visibility",
+        "wind_speed", "wind_deg", "clouds", "weather_main", "weather_description",
+        "sunrise", "sunset",
+    ],
+    "air_quality_ingestion_data": [
+        "lat", "long", "aqi", "co", "no", "no2", "o3", "so2", "pm2_5", "pm10", "nh3",
+    ],
+}
+
+# Processing-service rows derived from each raw table. Foreign keys cannot point at partitioned tables,
+# so these are cleaned up here instead of by ON DELETE CASCADE
+DEPENDENT_TABLES = {
+    "weather_ingestion_data": [
+        ("processed_weather_ingestion_data", "ingestion_data_uuid"),
+        ("combined_processed_ingestion_data", "weather_ingestion_uuid"),
+        ("combined_features", "weather_ingestion_uuid"),
+    ],
+    "air_quality_ingestion_data": [
+        ("processed_air_quality_ingestion_data", "ingestion_data_uuid"),
+        ("combined_processed_ingestion_data", "aq_ingestion_uuid"),
+        ("combined_features", "aq_ingestion_uuid"),
+    ],
+}
+
+def compact_duplicates(pool: ConnectionPool | None = None) -> dict:
+    """One-off cleanup: keep the earliest ingested copy of every observation and delete the rest.
+
+    Rows with an observation_timestamp are keyed on it; older rows on their measured values. Processed
+    rows of deleted duplicates are deleted with them, see DEPENDENT_TABLES, and the rollup buckets they
+    counted in are rebuilt.
+    """
+    removed = {}
+    sources = {table: source for source, table in ROLLUP_SOURCES.items()}
+    with (pool or get_pool()).connection() as conn:
+        cursor = conn.cursor()
+        for table, columns in LEGACY_OBSERVATION_COLUMNS.items():
+            cursor.execute("""
+                CREATE TEMP TABLE removed_rows (uuid UUID, ingestion_timestamp BIGINT, city_name TEXT, observed BIGINT)
+                ON COMMIT DROP;
+            """)
+            cursor.execute(f"""
+                WITH deleted AS (
+                    DELETE FROM {table} t
+                    USING (
+                        SELECT uuid, row_number() OVER (
+                            PARTITION BY city_name, data_source,
+                                         COALESCE(observation_timestamp::text, md5(row({", ".join(columns)})::text))
+                            ORDER BY ingestion_timestamp, uuid
+                        ) AS copy
+                        FROM {table}
+                    ) ranked
+                    WHERE t.uuid = ranked.uuid AND ranked.copy > 1
+                    RETURNING t.uuid, t.ingestion_timestamp, t.city_name,
+                              COALESCE(t.observation_timestamp * 1000, t.ingestion_timestamp) AS observed
+                )
+                INSERT INTO removed_rows SELECT uuid, ingestion_timestamp, city_name, observed FROM deleted;
+            """)
+            removed[table] = cursor.rowcount
+            logger.info(f"[Ingestion]: Removed {cursor.rowcount} duplicate rows from {table}")
+
+            for dependent, column in DEPENDENT_TABLES[table]:
+                # The processing service may not have created its tables yet
+                cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", (dependent,))
+                if cursor.fetchone()[0]:
+                    cursor.execute(f"DELETE FROM {dependent} d USING removed_rows r WHERE d.{column} = r.uuid;")
+                    removed[dependent] = removed.get(dependent, 0) + cursor.rowcount
+
+            # Rollups cannot subtract a min or max, so recompute the affected buckets from what is left
+            if removed[table] and table in sources:
+                rebuild_rollups(cursor, sources[table], "removed_rows")
+            cursor.execute("DROP TABLE removed_rows;")
+        cursor.close()
+    return {"removed": removed}
@@ -1,9 +1,15 @@
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from time import time
 from ingestions.WeatherDataIngestor import WeatherDataIngestor
 from ingestions.AirQualityDataIngestior import AirQualityIngestor
-import psycopg2
+from ingestions.ConnectionPool import get_pool
+from ingestions.TaskExecutor import get_executor
+from ingestions.JobQueue import JobQueue, JobContext
+from ingestions.tasks import compact_duplicates
+from ingestions.Partitions import ensure_partitions
+from ingestions.Rollups import query_rollups
+from concurrent.futures import ThreadPoolExecutor
 import glob
 from dotenv import load_dotenv
 import os
@@ -29,52 +35,120 @@ CITIES = [
 @app.on_event("startup")
 def run_migrations():
     
-    conn = psycopg2.connect(DATABASE_URL)
-    conn.autocommit = True
-    cur = conn.cursor()
+    with get_pool().connection() as conn:
+        cur = conn.cursor()
 
-    # Skapa tabell om inte migrationslogg finns
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS migrations (
-            id SERIAL PRIMARY KEY,
-            filename TEXT UNIQUE,
-            applied_at TIMESTAMP DEFAULT NOW()
-        );
-    """)
+        # Skapa tabell om inte migrationslogg finns
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS migrations (
+                id SERIAL PRIMARY KEY,
+                filename TEXT UNIQUE,
+                applied_at TIMESTAMP DEFAULT NOW()
+            );
+        """)
 
-    # Hitta alla SQL-filer
-    for file in sorted(glob.glob("migrations/*.sql")):
-        cur.execute("SELECT 1 FROM migrations WHERE filename = %s", (file,))
-        if cur.fetchone():
-            continue  # redan körd
+        # Hitta alla SQL-filer
+        for file in sorted(glob.glob("migrations/*.sql")):
+            cur.execute("SELECT 1 FROM migrations WHERE filename = %s", (file,))
+            if cur.fetchone():
+                continue  # redan körd
 
-        with open(file, "r") as f:
-            sql = f.read()
-            cur.execute(sql)
+            with open(file, "r") as f:
+                sql = f.read()
+                cur.execute(sql)
 
-        cur.execute("INSERT INTO migrations (filename) VALUES (%s)", (file,))
+            cur.execute("INSERT INTO migrations (filename) VALUES (%s)", (file,))
 
-    conn.commit()
-    cur.close()
-    conn.close()
+        cur.close()
+        # Monthly partitions for the coming months
+        ensure_partitions(conn)
 
+    jobs.start()
+
+
+@app.on_event("shutdown")
+def close_pool():
+    jobs.stop()
+    get_executor().shutdown()
+    get_pool().close()
+
+
+@app.get("/pool/stats")
+async def pool_stats():
+    return get_pool().stats()
+
+
+def ingest_weather(timestamp: int) -> list[dict]:
+    with WeatherDataIngestor(CITIES, timestamp) as ingestor:
+        return ingestor.process_cities()
 
-@app.get("/ingest")
-async def route():
-    try: 
-        timestamp = int(datetime.datetime.now(tz=datetime.UTC).timestamp() * 1000)
-        weather = WeatherDataIngestor(CITIES, timestamp).process_cities()
-        aq = AirQualityIngestor(CITIES, timestamp).process_cities()
 
+def ingest_air_quality(timestamp: int) -> list[dict]:
+    with AirQualityIngestor(CITIES, timestamp) as ingestor:
+        return ingestor.process_cities()
+
+
+def ingest(job: JobContext) -> dict:
+    """Job handler: fetch and save both sources at once, timing each as its own stage"""
+    timestamp = int(datetime.datetime.now(tz=datetime.UTC).timestamp() * 1000)
+    with get_pool().connection() as conn:
+        ensure_partitions(conn, from_ms=timestamp)
+
+    def staged(name, fn):
+        with job.stage(name):
+            return fn(timestamp)
+
+    with ThreadPoolExecutor(max_workers=2) as sources:
+        weather = sources.submit(staged, "weather", ingest_weather)
+        aq = sources.submit(staged, "air_quality", ingest_air_quality)
         return {
-            "status": "Success",
-            "weather": weather,
-            "air_quality": aq,
+            "weather": weather.result(),
+            "air_quality": aq.result(),
             "timestamp": timestamp
         }
-    except Exception as err:
-        return {
-            "status": "Error",
-            "message": str(err),
-            "timestamp": timestamp
-        }
\ No newline at end of file
+
+
+def rollups(**params) -> dict:
+    with get_pool().connection() as conn:
+        return query_rollups(conn, **params)
+
+
+def compact(job: JobContext) -> dict:
+    with job.stage("compact"):
+        return compact_duplicates()
+
+
+jobs = JobQueue({"ingest": ingest, "compact": compact})
+
+
+@app.get("/ingest")
+async def route():
+    # Returns straight away; a second call while this run is still queued gets the same job
+    job_id = await get_executor().run_in_thread(jobs.enqueue, "ingest")
+    return {"job_id": job_id, "status": "pending"}
+
+
+@app.post("/ingest/compact")
+async def route():
+    # One-off removal of duplicate observations stored before natural keys were enforced
+    job_id = await get_executor().run_in_thread(jobs.enqueue, "compact")
+    return {"job_id": job_id, "status": "pending"}
+
+
+@app.get("/rollups")
+async def route(source: str, metric: str, granularity: str = "day", from_ms: int | None = None, to_ms: int | None = None, city: str | None = None):
+    # Answered from observation_rollups alone, e.g. /rollups?source=air_quality&metric=pm2_5&granularity=day
+    try:
+        return await get_executor().run_in_thread(
+            rollups, source=source, metric=metric, granularity=granularity, from_ms=from_ms, to_ms=to_ms, city=city
+        )
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+
+
+@app.get("/jobs/{job_id}")
+async def route(job_id: str):
+    job = await get_executor().run_in_thread(jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
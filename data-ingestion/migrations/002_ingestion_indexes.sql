@@ -0,0 +1,14 @@
+-- Timestamp-leading: serves ORDER BY ingestion_timestamp, watermark range scans and an
+-- ordered merge join between the two raw tables without a full sort
+CREATE INDEX IF NOT EXISTS weather_ingestion_data_ts_city_idx
+    ON weather_ingestion_data (ingestion_timestamp, city_name);
+
+CREATE INDEX IF NOT EXISTS air_quality_ingestion_data_ts_city_idx
+    ON air_quality_ingestion_data (ingestion_timestamp, city_name);
+
+-- City-leading: serves per-city lookups of the join key
+CREATE INDEX IF NOT EXISTS weather_ingestion_data_city_ts_idx
+    ON weather_ingestion_data (city_name, ingestion_timestamp);
+
+CREATE INDEX IF NOT EXISTS air_quality_ingestion_data_city_ts_idx
+    ON air_quality_ingestion_data (city_name, ingestion_timestamp);
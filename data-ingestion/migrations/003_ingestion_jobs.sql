@@ -0,0 +1,21 @@
+-- Shared by the ingestion and processing services; each only claims its own kinds
+CREATE TABLE IF NOT EXISTS pipeline_jobs (
+  id UUID NOT NULL DEFAULT gen_random_uuid() PRIMARY KEY,
+  kind TEXT NOT NULL,
+  params JSONB NOT NULL DEFAULT '{}',
+  status TEXT NOT NULL DEFAULT 'pending',
+  current_stage TEXT,
+  stages JSONB NOT NULL DEFAULT '{}',
+  result JSONB,
+  error TEXT,
+  created_at BIGINT NOT NULL,
+  started_at BIGINT,
+  finished_at BIGINT
+);
+
+-- At most one identical job waiting at a time
+CREATE UNIQUE INDEX IF NOT EXISTS pipeline_jobs_pending_dedup_idx
+    ON pipeline_jobs (kind, params) WHERE status = 'pending';
+
+CREATE INDEX IF NOT EXISTS pipeline_jobs_pending_idx
+    ON pipeline_jobs (created_at) WHERE status = 'pending';
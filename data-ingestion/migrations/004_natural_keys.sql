@@ -0,0 +1,11 @@
+-- Observation time reported by the API (unix seconds); NULL on rows ingested before it was stored
+ALTER TABLE weather_ingestion_data ADD COLUMN IF NOT EXISTS observation_timestamp BIGINT;
+ALTER TABLE air_quality_ingestion_data ADD COLUMN IF NOT EXISTS observation_timestamp BIGINT;
+
+-- Natural keys: one row per city, observation and source. NULLs never conflict, so older rows are
+-- left to the compaction job
+CREATE UNIQUE INDEX IF NOT EXISTS weather_ingestion_data_natural_key
+    ON weather_ingestion_data (city_name, observation_timestamp, data_source);
+
+CREATE UNIQUE INDEX IF NOT EXISTS air_quality_ingestion_data_natural_key
+    ON air_quality_ingestion_data (city_name, observation_timestamp, data_source);
@@ -0,0 +1,90 @@
+-- Monthly range partitions on ingestion_timestamp (epoch milliseconds, UTC) for every month overlapping
+-- [from_ms, to_ms]; partitions are named <parent>_pYYYY_MM and existing ones are left alone.
+-- Shared with the data-processing service, whose tables are partitioned the same way.
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(parent TEXT, from_ms BIGINT, to_ms BIGINT)
+RETURNS INT AS $$
+DECLARE
+    month_start TIMESTAMP := date_trunc('month', to_timestamp(from_ms / 1000.0) AT TIME ZONE 'UTC');
+    last_month TIMESTAMP := date_trunc('month', to_timestamp(to_ms / 1000.0) AT TIME ZONE 'UTC');
+    part_name TEXT;
+    created INT := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        part_name := format('%s_p%s', parent, to_char(month_start, 'YYYY_MM'));
+        IF to_regclass(part_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%s) TO (%s)',
+                part_name, parent,
+                (extract(epoch FROM month_start) * 1000)::BIGINT,
+                (extract(epoch FROM month_start + INTERVAL '1 month') * 1000)::BIGINT
+            );
+            created := created + 1;
+        END IF;
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Rebuild a plain table as a monthly-partitioned one with the same columns and rows. The primary key has
+-- to include ingestion_timestamp, so foreign keys to the old table and views over it are dropped with it.
+CREATE OR REPLACE FUNCTION convert_to_monthly_partitions(tbl TEXT, primary_key TEXT[], months_ahead INT DEFAULT 2)
+RETURNS VOID AS $$
+DECLARE
+    old_name TEXT := tbl || '_unpartitioned';
+    index_name TEXT;
+    first_ms BIGINT;
+    now_ms BIGINT := (extract(epoch FROM now()) * 1000)::BIGINT;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass(tbl)) IS DISTINCT FROM 'r' THEN
+        RETURN;
+    END IF;
+
+    -- Free the index and constraint names for the new table
+    FOR index_name IN
+        SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE i.indrelid = to_regclass(tbl)
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', index_name, left(index_name, 48) || '_unpartitioned');
+    END LOOP;
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', tbl, old_name);
+
+    EXECUTE format(
+        'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (ingestion_timestamp)',
+        tbl, old_name
+    );
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (%s)', tbl, array_to_string(primary_key, ', '));
+
+    EXECUTE format('SELECT MIN(ingestion_timestamp) FROM %I', old_name) INTO first_ms;
+    PERFORM ensure_monthly_partitions(
+        tbl,
+        COALESCE(first_ms, now_ms),
+        now_ms + months_ahead * 31 * 24 * 3600 * 1000::BIGINT
+    );
+    EXECUTE format('INSERT INTO %I SELECT * FROM %I', tbl, old_name);
+    EXECUTE format('DROP TABLE %I CASCADE', old_name);
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT convert_to_monthly_partitions('weather_ingestion_data', ARRAY['uuid', 'ingestion_timestamp']);
+SELECT convert_to_monthly_partitions('air_quality_ingestion_data', ARRAY['uuid', 'ingestion_timestamp']);
+
+-- Indexes from 002, now created on every partition
+CREATE INDEX IF NOT EXISTS weather_ingestion_data_ts_city_idx
+    ON weather_ingestion_data (ingestion_timestamp, city_name);
+
+CREATE INDEX IF NOT EXISTS air_quality_ingestion_data_ts_city_idx
+    ON air_quality_ingestion_data (ingestion_timestamp, city_name);
+
+CREATE INDEX IF NOT EXISTS weather_ingestion_data_city_ts_idx
+    ON weather_ingestion_data (city_name, ingestion_timestamp);
+
+CREATE INDEX IF NOT EXISTS air_quality_ingestion_data_city_ts_idx
+    ON air_quality_ingestion_data (city_name, ingestion_timestamp);
+
+-- Natural keys from 004. A unique index on a partitioned table must contain ingestion_timestamp, which
+-- would defeat the point, so BulkWriter enforces uniqueness itself and these serve its lookups
+CREATE INDEX IF NOT EXISTS weather_ingestion_data_natural_key
+    ON weather_ingestion_data (city_name, observation_timestamp, data_source);
+
+CREATE INDEX IF NOT EXISTS air_quality_ingestion_data_natural_key
+    ON air_quality_ingestion_data (city_name, observation_timestamp, data_source);
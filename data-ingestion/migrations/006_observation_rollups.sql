@@ -0,0 +1,48 @@
+-- Hourly and daily aggregates per source, metric and city, kept up to date by BulkWriter in the same
+-- transaction as each ingestion batch. bucket is the start of the UTC hour or day in epoch milliseconds;
+-- the variance follows from count, sum and sum_sq
+CREATE TABLE IF NOT EXISTS observation_rollups (
+  source TEXT NOT NULL,
+  metric TEXT NOT NULL,
+  granularity TEXT NOT NULL,
+  city_name TEXT NOT NULL,
+  bucket BIGINT NOT NULL,
+  count BIGINT NOT NULL,
+  sum DOUBLE PRECISION NOT NULL,
+  min DOUBLE PRECISION NOT NULL,
+  max DOUBLE PRECISION NOT NULL,
+  sum_sq DOUBLE PRECISION NOT NULL,
+  PRIMARY KEY (source, metric, granularity, city_name, bucket)
+);
+
+-- Range queries over all cities
+CREATE INDEX IF NOT EXISTS observation_rollups_bucket_idx
+    ON observation_rollups (source, metric, granularity, bucket);
+
+-- Backfill from the rows ingested so far; same metrics as ROLLUP_METRICS in ingestions/Rollups.py
+INSERT INTO observation_rollups (source, metric, granularity, city_name, bucket, count, sum, min, max, sum_sq)
+SELECT 'weather', m.metric, g.granularity, o.city_name, o.observed - mod(o.observed, g.width),
+       COUNT(*), SUM(m.value), MIN(m.value), MAX(m.value), SUM(m.value * m.value)
+FROM (SELECT *, COALESCE(observation_timestamp * 1000, ingestion_timestamp) AS observed FROM weather_ingestion_data) o
+CROSS JOIN (VALUES ('hour', 3600000::bigint), ('day', 86400000::bigint)) AS g (granularity, width)
+CROSS JOIN LATERAL (VALUES
+    ('temp', o.temp::float8), ('feels_like', o.feels_like::float8), ('temp_min', o.temp_min::float8),
+    ('temp_max', o.temp_max::float8), ('pressure', o.pressure::float8), ('humidity', o.humidity::float8),
+    ('sea_level', o.sea_level::float8), ('grnd_level', o.grnd_level::float8), ('visibility', o.visibility::float8),
+    ('wind_speed', o.wind_speed::float8), ('wind_deg', o.wind_deg::float8), ('clouds', o.clouds::float8)
+) AS m (metric, value)
+GROUP BY m.metric, g.granularity, o.city_name, o.observed - mod(o.observed, g.width)
+ON CONFLICT DO NOTHING;
+
+INSERT INTO observation_rollups (source, metric, granularity, city_name, bucket, count, sum, min, max, sum_sq)
+SELECT 'air_quality', m.metric, g.granularity, o.city_name, o.observed - mod(o.observed, g.width),
+       COUNT(*), SUM(m.value), MIN(m.value), MAX(m.value), SUM(m.value * m.value)
+FROM (SELECT *, COALESCE(observation_timestamp * 1000, ingestion_timestamp) AS observed FROM air_quality_ingestion_data) o
+CROSS JOIN (VALUES ('hour', 3600000::bigint), ('day', 86400000::bigint)) AS g (granularity, width)
+CROSS JOIN LATERAL (VALUES
+    ('aqi', o.aqi::float8), ('co', o.co::float8), ('no', o.no::float8), ('no2', o.no2::float8),
+    ('o3', o.o3::float8), ('so2', o.so2::float8), ('pm2_5', o.pm2_5::float8), ('pm10', o.pm10::float8),
+    ('nh3', o.nh3::float8)
+) AS m (metric, value)
+GROUP BY m.metric, g.granularity, o.city_name, o.observed - mod(o.observed, g.width)
+ON CONFLICT DO NOTHING;
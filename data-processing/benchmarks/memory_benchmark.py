@@ -0,0 +1,76 @@
+# memory_benchmark.py - bytes per row of the processing frames, default vs compact dtypes
+#
+# Run from data-processing/ against a scratch database:
+#   DATABASE_URL=postgresql://... python -m benchmarks.memory_benchmark --sizes 10000 100000 1000000
+#
+# Uses the same synthetic weather rows as save_benchmark and removes them afterwards.
+import argparse
+import os
+from time import perf_counter
+import pandas as pd
+import psycopg2
+from dotenv import load_dotenv
+from processors.ConnectionPool import ConnectionPool
+from processors.WeatherDataProcessor import WeatherDataProcessor
+from .save_benchmark import BENCHMARK_SOURCE, seed_weather_rows, cleanup
+
+load_dotenv()
+
+MODES = {
+    "default": {"compact_dtypes": False, "sparse_dummies": False},
+    "compact": {"compact_dtypes": True, "sparse_dummies": False},
+    "compact+sparse": {"compact_dtypes": True, "sparse_dummies": True},
+}
+
+def fetch_rows(processor: WeatherDataProcessor) -> list[dict]:
+    cursor = processor.conn.cursor()
+    cursor.execute("SELECT * FROM weather_ingestion_data WHERE data_source = %s;", (BENCHMARK_SOURCE,))
+    columns = [desc[0] for desc in cursor.description]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    cursor.close()
+    return rows
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+def measure(pool: ConnectionPool, rows: list[dict], compact_dtypes: bool, sparse_dummies: bool) -> tuple[float, float, float]:
+    """(raw frame bytes/row, processed frame bytes/row, process_data seconds)"""
+    with WeatherDataProcessor(pool=pool) as processor:
+        processor.compact_dtypes = compact_dtypes
+        processor.sparse_dummies = sparse_dummies
+        raw = frame_bytes(processor.to_frame(rows))
+        processor.unprocessed_data = rows
+        start = perf_counter()
+        processor.process_data()
+        elapsed = perf_counter() - start
+        processed = frame_bytes(processor.processed_data)
+    return raw / len(rows), processed / len(rows), elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark processing memory per row")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    pool = ConnectionPool(minconn=1, maxconn=2)
+    conn = psycopg2.connect(os.getenv("DATABASE_URL"))
+
+    print(f"{'rows':>10} {'mode':>15} {'raw B/row':>10} {'processed B/row':>16} {'process s':>10} {'saving':>8}")
+    for n in args.sizes:
+        cleanup(conn)
+        seed_weather_rows(conn, n)
+        try:
+            with WeatherDataProcessor(pool=pool) as processor:
+                rows = fetch_rows(processor)
+            baseline = None
+            for mode, options in MODES.items():
+                raw, processed, elapsed = measure(pool, rows, **options)
+                baseline = baseline or processed
+                print(f"{n:>10,} {mode:>15} {raw:>10,.0f} {processed:>16,.0f} {elapsed:>10.3f} {1 - processed / baseline:>8.1%}")
+        finally:
+            cleanup(conn)
+
+    conn.close()
+    pool.close()
+
+if __name__ == "__main__":
+    main()
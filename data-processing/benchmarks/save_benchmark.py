@@ -0,0 +1,121 @@
+# save_benchmark.py - rows/sec of the processor save path, legacy per-row vs bulk
+#
+# Run from data-processing/ against a scratch database:
+#   DATABASE_URL=postgresql://... python -m benchmarks.save_benchmark --sizes 10000 100000 1000000
+#
+# Synthetic rows are tagged with data_source = 'benchmark' and removed afterwards,
+# together with their processed rows.
+import argparse
+import os
+from time import perf_counter
+import psycopg2
+from dotenv import load_dotenv
+from processors.ConnectionPool import ConnectionPool
+from processors.WeatherDataProcessor import WeatherDataProcessor
+from processors.Partitions import ensure_partitions, PARTITIONED_TABLES, RAW_TABLES
+
+load_dotenv()
+
+BENCHMARK_SOURCE = "benchmark"
+FIRST_TIMESTAMP = 1700000000000
+
+def seed_weather_rows(conn, n: int):
+    # Synthetic rows are one second apart, which may predate every existing partition
+    ensure_partitions(conn, RAW_TABLES + PARTITIONED_TABLES, FIRST_TIMESTAMP, FIRST_TIMESTAMP + n * 1000)
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO weather_ingestion_data (
+            lat, lon, temp, feels_like, temp_min, temp_max,
+            pressure, humidity, sea_level, grnd_level, visibility,
+            wind_speed, wind_deg, clouds, weather_main, weather_description,
+            sunrise, sunset, city_name, ingestion_timestamp, data_source
+        )
+        SELECT
+            59.3 + random(), 18.0 + random(), 30 * random() - 10, 30 * random() - 10, -10, 20,
+            1000 + (random() * 30)::int, (random() * 100)::int, 1013, 1000, 10000,
+            10 * random(), 360 * random(), (random() * 100)::int,
+            (ARRAY['Clear', 'Clouds', 'Rain'])[1 + i % 3],
+            (ARRAY['clear sky', 'few clouds', 'light rain', 'overcast clouds'])[1 + i % 4],
+            1700000000, 1700040000,
+            'City ' || (i % 8),
+            %s + i * 1000,
+            %s
+        FROM generate_series(1, %s) AS i;
+    """, (FIRST_TIMESTAMP, BENCHMARK_SOURCE, n))
+    conn.commit()
+    cur.close()
+
+def cleanup(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        DELETE FROM processed_weather_ingestion_data p
+        USING weather_ingestion_data w
+        WHERE p.ingestion_data_uuid = w.uuid AND p.ingestion_timestamp = w.ingestion_timestamp AND w.data_source = %s;
+    """, (BENCHMARK_SOURCE,))
+    cur.execute("DELETE FROM weather_ingestion_data WHERE data_source = %s;", (BENCHMARK_SOURCE,))
+    conn.commit()
+    cur.close()
+
+def load_processor(pool: ConnectionPool) -> WeatherDataProcessor:
+    processor = WeatherDataProcessor(pool=pool)
+    cursor = processor.conn.cursor()
+    cursor.execute("SELECT * FROM weather_ingestion_data WHERE data_source = %s;", (BENCHMARK_SOURCE,))
+    columns = [desc[0] for desc in cursor.description]
+    processor.unprocessed_data = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    cursor.close()
+    return processor.process_data()
+
+def legacy_save(processor: WeatherDataProcessor):
+    """The pre-bulk save path: iterrows, one execute and fetchone per row"""
+    cursor = processor.conn.cursor()
+    processor.processed_data.drop(columns=["data_source"], inplace=True, errors='ignore')
+    processor.processed_data.columns = processor.processed_data.columns.str.replace(" ", "_")
+    insert_query = """
+    INSERT INTO processed_weather_ingestion_data (ingestion_data_uuid, ingestion_timestamp, json_data, processed_timestamp)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (ingestion_data_uuid, ingestion_timestamp) DO UPDATE
+    SET json_data = EXCLUDED.json_data, processed_timestamp = EXCLUDED.processed_timestamp
+    RETURNING json_build_object('ingestion_data_uuid', ingestion_data_uuid, 'json_data', json_data, 'processed_timestamp', processed_timestamp);
+    """
+    for _, row in processor.processed_data.iterrows():
+        d_row = row.drop(labels=["uuid", "ingestion_timestamp"])
+        cursor.execute(insert_query, (row["uuid"], int(row["ingestion_timestamp"]), d_row.to_json(), processor.timestamp))
+        cursor.fetchone()
+    processor.conn.commit()
+    cursor.close()
+
+def time_save(pool: ConnectionPool, n: int, save) -> float:
+    with load_processor(pool) as processor:
+        start = perf_counter()
+        save(processor)
+        elapsed = perf_counter() - start
+    return n / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the processor save path")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--legacy-max", type=int, default=100_000, help="skip the per-row path above this size")
+    args = parser.parse_args()
+
+    pool = ConnectionPool(minconn=1, maxconn=2)
+    conn = psycopg2.connect(os.getenv("DATABASE_URL"))
+
+    print(f"{'rows':>10} {'legacy rows/s':>15} {'bulk rows/s':>15} {'bulk+returning rows/s':>22}")
+    for n in args.sizes:
+        cleanup(conn)
+        seed_weather_rows(conn, n)
+        try:
+            legacy = time_save(pool, n, legacy_save) if n <= args.legacy_max else None
+            bulk = time_save(pool, n, lambda p: p.save_data(return_rows=False))
+            bulk_returning = time_save(pool, n, lambda p: p.save_data(return_rows=True))
+        finally:
+            cleanup(conn)
+
+        legacy_col = f"{legacy:,.0f}" if legacy else "skipped"
+        print(f"{n:>10,} {legacy_col:>15} {bulk:>15,.0f} {bulk_returning:>22,.0f}")
+
+    conn.close()
+    pool.close()
+
+if __name__ == "__main__":
+    main()
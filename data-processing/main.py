@@ -1,66 +1,174 @@
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from time import time
 import glob
 from dotenv import load_dotenv
 import os
 import json
-import psycopg2
-from processors.WeatherDataProcessor import WeatherDataProcessor
-from processors.AirQualityProcessor import AirQualityDataProcessor
-from processors.CombinedDataProcessor import CombinedDataProcessor
+import datetime
+import threading
+from processors.ConnectionPool import get_pool
+from processors.TaskExecutor import get_executor
+from processors.JobQueue import JobQueue, JobContext
+from processors.PipelineListener import PipelineListener
+from processors.Pipeline import Pipeline
+from processors.Partitions import ensure_partitions
+from processors.Retention import archive_partitions, RETENTION_MONTHS, RETENTION_DROP_DETACHED
+from processors.tasks import run_processor, run_partitioned, refresh_combined_view, export_features, PROCESSING_SHARDS
 
 load_dotenv()
 
 DATABASE_URL=os.getenv("DATABASE_URL")
+# Process each ingestion batch as soon as its NOTIFY arrives instead of waiting for /process/* calls
+PROCESS_ON_INGESTION = os.getenv("PROCESS_ON_INGESTION", "true").lower() == "true"
 
 app = FastAPI()
 
 
+# Job handlers run on the queue's worker threads; the pandas work itself goes to the process pool
+
+def process_job(name: str):
+    def handler(job: JobContext, shards: int = PROCESSING_SHARDS, **params):
+        with get_pool().connection() as conn:
+            ensure_partitions(conn)
+        if shards > 1:
+            # The shards themselves go to the process pool
+            return run_partitioned(name, shards, return_rows=False, job=job, **params)
+        return get_executor().submit_to_process(run_processor, name, return_rows=False, job=job, **params).result()
+    return handler
+
+jobs = JobQueue({
+    "process_weather": process_job("weather"),
+    "process_aq": process_job("aq"),
+    "process_combined": process_job("combined"),
+    "refresh_combined_view": refresh_combined_view,
+    "pipeline": lambda job, force=False: Pipeline().run(force),
+    "retention": lambda job, **params: archive_partitions(**params),
+})
+
+
+# Sources heard from per ingestion batch, until both have landed
+landed: dict[int, set[str]] = {}
+landed_lock = threading.Lock()
+
+def on_ingestion_saved(event: dict):
+    # Incremental jobs for just this batch
+    params = {"ingestion_timestamp": event["ingestion_timestamp"]}
+    jobs.enqueue("process_weather" if event["source"] == "weather" else "process_aq", params)
+
+    # Weather rows pair with the latest AQ row stored before them, so wait for the batch's own AQ rows
+    with landed_lock:
+        sources = landed.setdefault(event["ingestion_timestamp"], set())
+        sources.add(event["source"])
+        ready = {"weather", "air_quality"} <= sources
+        if ready:
+            del landed[event["ingestion_timestamp"]]
+        # A batch whose other source never saved anything is left to the next catch_up()
+        for stale in [ts for ts in landed if ts < event["ingestion_timestamp"] - 86_400_000]:
+            del landed[stale]
+    if ready:
+        jobs.enqueue("process_combined", params)
+
+def catch_up():
+    # Batches ingested while nobody was listening are still past the watermarks, and their combined rows
+    # were never built; the combined run only fetches pairs that have no combined row yet
+    jobs.enqueue("process_weather")
+    jobs.enqueue("process_aq")
+    jobs.enqueue("process_combined")
+
+listener = PipelineListener({"ingestion_saved": on_ingestion_saved}, on_connect=catch_up)
+
+
 @app.on_event("startup")
 def run_migrations():
     
-    conn = psycopg2.connect(DATABASE_URL)
-    conn.autocommit = True
-    cur = conn.cursor()
+    with get_pool().connection() as conn:
+        cur = conn.cursor()
+
+        # Skapa tabell om inte migrationslogg finns
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS migrations (
+                id SERIAL PRIMARY KEY,
+                filename TEXT UNIQUE,
+                applied_at TIMESTAMP DEFAULT NOW()
+            );
+        """)
 
-    # Skapa tabell om inte migrationslogg finns
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS migrations (
-            id SERIAL PRIMARY KEY,
-            filename TEXT UNIQUE,
-            applied_at TIMESTAMP DEFAULT NOW()
-        );
-    """)
+        # Hitta alla SQL-filer
+        for file in sorted(glob.glob("migrations/*.sql")):
+            cur.execute("SELECT 1 FROM migrations WHERE filename = %s", (file,))
+            if cur.fetchone():
+                continue  # redan körd
 
-    # Hitta alla SQL-filer
-    for file in sorted(glob.glob("migrations/*.sql")):
-        cur.execute("SELECT 1 FROM migrations WHERE filename = %s", (file,))
-        if cur.fetchone():
-            continue  # redan körd
+            with open(file, "r") as f:
+                sql = f.read()
+                cur.execute(sql)
 
-        with open(file, "r") as f:
-            sql = f.read()
-            cur.execute(sql)
+            cur.execute("INSERT INTO migrations (filename) VALUES (%s)", (file,))
 
-        cur.execute("INSERT INTO migrations (filename) VALUES (%s)", (file,))
+        cur.close()
+        # Monthly partitions for the coming months
+        ensure_partitions(conn)
 
-    conn.commit()
-    cur.close()
-    conn.close()
+    jobs.start()
+    if PROCESS_ON_INGESTION:
+        listener.start()
 
 
+@app.on_event("shutdown")
+def close_pool():
+    listener.stop()
+    jobs.stop()
+    get_executor().shutdown()
+    get_pool().close()
+
+
+@app.get("/pool/stats")
+async def pool_stats():
+    return get_pool().stats()
+
+
+# Processing runs as a background job; poll /jobs/{job_id} for progress and the result
+
 @app.get("/process/weather")
-async def route():
-    processor = WeatherDataProcessor().fetch_data().process_data().save_data()
-    return processor.result
+async def route(full_rebuild: bool = False, chunk_size: int | None = None, shards: int | None = None):
+    job_id = await get_executor().run_in_thread(jobs.enqueue, "process_weather", {"full_rebuild": full_rebuild, "chunk_size": chunk_size, "shards": shards})
+    return {"job_id": job_id, "status": "pending"}
 
 @app.get("/process/combined")
-async def route():
-    processor = CombinedDataProcessor().fetch_data().process_data().save_data()
-    return processor.result
+async def route(full_rebuild: bool = False, chunk_size: int | None = None, in_database: bool = False, shards: int | None = None):
+    if in_database:
+        job_id = await get_executor().run_in_thread(jobs.enqueue, "refresh_combined_view")
+    else:
+        job_id = await get_executor().run_in_thread(jobs.enqueue, "process_combined", {"full_rebuild": full_rebuild, "chunk_size": chunk_size, "shards": shards})
+    return {"job_id": job_id, "status": "pending"}
 
 @app.get("/process/aq")
+async def route(full_rebuild: bool = False, chunk_size: int | None = None, shards: int | None = None):
+    job_id = await get_executor().run_in_thread(jobs.enqueue, "process_aq", {"full_rebuild": full_rebuild, "chunk_size": chunk_size, "shards": shards})
+    return {"job_id": job_id, "status": "pending"}
+
+@app.post("/pipeline/run")
+async def route(force: bool = False):
+    # The job's result is the wall-clock report: per-node status, start offset and seconds
+    job_id = await get_executor().run_in_thread(jobs.enqueue, "pipeline", {"force": force})
+    return {"job_id": job_id, "status": "pending"}
+
+@app.post("/retention/run")
+async def route(months: int = RETENTION_MONTHS, drop: bool = RETENTION_DROP_DETACHED):
+    # Partitions older than the last `months` whole months are written to data/archive and detached
+    job_id = await get_executor().run_in_thread(jobs.enqueue, "retention", {"months": months, "drop": drop})
+    return {"job_id": job_id, "status": "pending"}
+
+@app.get("/jobs/{job_id}")
+async def route(job_id: str):
+    job = await get_executor().run_in_thread(jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/export/features")
 async def route():
-    processor = AirQualityDataProcessor().fetch_data().process_data().save_data()
-    return processor.result
\ No newline at end of file
+    timestamp = int(datetime.datetime.now(tz=datetime.UTC).timestamp() * 1000)
+    path = await get_executor().run_in_thread(export_features, f"data/features/combined_features_{timestamp}.parquet")
+    return {"status": "Success", "path": path, "timestamp": timestamp}
\ No newline at end of file
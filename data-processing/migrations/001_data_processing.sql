@@ -1,11 +1,12 @@
+-- No foreign keys to the raw tables: they are partitioned (see data-ingestion 005), so uuid alone is not unique there
 CREATE TABLE IF NOT EXISTS processed_weather_ingestion_data (
-  ingestion_data_uuid UUID NOT NULL PRIMARY KEY REFERENCES weather_ingestion_data(uuid) ON DELETE CASCADE,
+  ingestion_data_uuid UUID NOT NULL PRIMARY KEY,
   json_data JSONB,
   processed_timestamp BIGINT NOT NULL
 );
 
 CREATE TABLE IF NOT EXISTS processed_air_quality_ingestion_data (
-  ingestion_data_uuid UUID NOT NULL PRIMARY KEY REFERENCES air_quality_ingestion_data(uuid) ON DELETE CASCADE,
+  ingestion_data_uuid UUID NOT NULL PRIMARY KEY,
   json_data JSONB,
   processed_timestamp BIGINT NOT NULL
 );
@@ -13,8 +14,8 @@ CREATE TABLE IF NOT EXISTS processed_air_quality_ingestion_data (
 
 CREATE TABLE IF NOT EXISTS combined_processed_ingestion_data (
   uuid UUID NOT NULL DEFAULT gen_random_uuid() PRIMARY KEY,
-  weather_ingestion_uuid UUID NOT NULL REFERENCES weather_ingestion_data(uuid) ON DELETE CASCADE,
-  aq_ingestion_uuid UUID NOT NULL REFERENCES air_quality_ingestion_data(uuid) ON DELETE CASCADE,
+  weather_ingestion_uuid UUID NOT NULL,
+  aq_ingestion_uuid UUID NOT NULL,
   json_data JSONB,
   ingestion_timestamp BIGINT NOT NULL,
   UNIQUE (weather_ingestion_uuid, aq_ingestion_uuid)
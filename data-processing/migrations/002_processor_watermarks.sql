@@ -0,0 +1,5 @@
+CREATE TABLE IF NOT EXISTS processor_watermarks (
+  processor TEXT NOT NULL PRIMARY KEY,
+  high_water_mark BIGINT NOT NULL,
+  updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,8 @@
+CREATE TABLE IF NOT EXISTS category_vocabulary (
+  column_name TEXT NOT NULL,
+  category TEXT NOT NULL,
+  idx INT NOT NULL,
+  created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (column_name, category),
+  UNIQUE (column_name, idx)
+);
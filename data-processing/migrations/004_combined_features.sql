@@ -0,0 +1,46 @@
+-- No foreign keys to the raw tables: they are partitioned (see data-ingestion 005), so uuid alone is not unique there
+CREATE TABLE IF NOT EXISTS combined_features (
+  weather_ingestion_uuid UUID NOT NULL,
+  aq_ingestion_uuid UUID NOT NULL,
+  ingestion_timestamp BIGINT NOT NULL,
+  -- Weather
+  lat DOUBLE PRECISION NOT NULL,
+  lon DOUBLE PRECISION NOT NULL,
+  temp DOUBLE PRECISION NOT NULL,
+  feels_like DOUBLE PRECISION NOT NULL,
+  temp_min DOUBLE PRECISION NOT NULL,
+  temp_max DOUBLE PRECISION NOT NULL,
+  pressure INT NOT NULL,
+  humidity INT NOT NULL,
+  sea_level INT NOT NULL,
+  grnd_level INT NOT NULL,
+  visibility INT NOT NULL,
+  wind_speed DOUBLE PRECISION NOT NULL,
+  wind_deg DOUBLE PRECISION NOT NULL,
+  clouds INT NOT NULL,
+  sunrise BIGINT NOT NULL,
+  sunset BIGINT NOT NULL,
+  -- Air quality
+  aqi SMALLINT NOT NULL,
+  co DOUBLE PRECISION NOT NULL,
+  no DOUBLE PRECISION NOT NULL,
+  no2 DOUBLE PRECISION NOT NULL,
+  o3 DOUBLE PRECISION NOT NULL,
+  so2 DOUBLE PRECISION NOT NULL,
+  pm2_5 DOUBLE PRECISION NOT NULL,
+  pm10 DOUBLE PRECISION NOT NULL,
+  nh3 DOUBLE PRECISION NOT NULL,
+  -- Derived
+  pollution_weather_index DOUBLE PRECISION NOT NULL,
+  temp_pollution_ratio DOUBLE PRECISION NOT NULL,
+  wind_pollution_clearance DOUBLE PRECISION NOT NULL,
+  environmental_stress SMALLINT NOT NULL,
+  month SMALLINT NOT NULL,
+  day SMALLINT NOT NULL,
+  year SMALLINT NOT NULL,
+  -- Indices into category_vocabulary
+  weather_main_code SMALLINT NOT NULL,
+  weather_description_code SMALLINT NOT NULL,
+  city_name_code SMALLINT NOT NULL,
+  PRIMARY KEY (weather_ingestion_uuid, aq_ingestion_uuid)
+);
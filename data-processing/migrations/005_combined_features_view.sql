@@ -0,0 +1,52 @@
+-- Database-side equivalent of CombinedDataProcessor.process_data() (before one-hot encoding)
+CREATE MATERIALIZED VIEW IF NOT EXISTS combined_features_view AS
+SELECT
+    w.uuid AS weather_ingestion_uuid,
+    aq.uuid AS aq_ingestion_uuid,
+    w.ingestion_timestamp,
+    w.city_name,
+    -- Weather-kolumner
+    w.lat,
+    w.lon,
+    w.temp,
+    w.feels_like,
+    w.temp_min,
+    w.temp_max,
+    w.pressure,
+    w.humidity,
+    w.sea_level,
+    w.grnd_level,
+    w.visibility,
+    w.wind_speed,
+    w.wind_deg,
+    w.clouds,
+    w.weather_main,
+    w.weather_description,
+    w.sunrise,
+    w.sunset,
+    -- Air Quality-kolumner
+    aq.aqi,
+    aq.co,
+    aq.no,
+    aq.no2,
+    aq.o3,
+    aq.so2,
+    aq.pm2_5,
+    aq.pm10,
+    aq.nh3,
+    -- Derived features
+    (aq.aqi * w.humidity)::DOUBLE PRECISION / 100 AS pollution_weather_index,
+    w.temp / (aq.pm2_5 + 1) AS temp_pollution_ratio,
+    w.wind_speed / (aq.aqi + 1) AS wind_pollution_clearance,
+    aq.aqi + (w.humidity > 80)::INT + (w.wind_speed < 2)::INT + (w.clouds > 80)::INT AS environmental_stress,
+    EXTRACT(MONTH FROM to_timestamp(w.ingestion_timestamp / 1000.0) AT TIME ZONE 'UTC')::INT AS month,
+    EXTRACT(DAY FROM to_timestamp(w.ingestion_timestamp / 1000.0) AT TIME ZONE 'UTC')::INT AS day,
+    EXTRACT(YEAR FROM to_timestamp(w.ingestion_timestamp / 1000.0) AT TIME ZONE 'UTC')::INT AS year
+FROM weather_ingestion_data w
+JOIN air_quality_ingestion_data aq
+    ON w.city_name = aq.city_name
+   AND w.ingestion_timestamp = aq.ingestion_timestamp;
+
+-- Required for REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS combined_features_view_uuids
+    ON combined_features_view (weather_ingestion_uuid, aq_ingestion_uuid);
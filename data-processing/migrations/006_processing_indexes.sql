@@ -0,0 +1,6 @@
+-- Training data is always read newest first
+CREATE INDEX IF NOT EXISTS combined_processed_ingestion_data_ts_idx
+    ON combined_processed_ingestion_data (ingestion_timestamp);
+
+CREATE INDEX IF NOT EXISTS combined_features_ts_idx
+    ON combined_features (ingestion_timestamp);
@@ -0,0 +1,8 @@
+-- Last successful output of each pipeline node and the input fingerprint it was computed from
+CREATE TABLE IF NOT EXISTS pipeline_node_cache (
+  node TEXT NOT NULL PRIMARY KEY,
+  input_fingerprint TEXT NOT NULL,
+  output JSONB,
+  seconds DOUBLE PRECISION NOT NULL,
+  finished_at BIGINT NOT NULL
+);
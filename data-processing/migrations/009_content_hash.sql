@@ -0,0 +1,5 @@
+-- Hash of each row's stored content; upserts only rewrite rows whose hash changed
+ALTER TABLE processed_weather_ingestion_data ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE processed_air_quality_ingestion_data ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE combined_processed_ingestion_data ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE combined_features ADD COLUMN IF NOT EXISTS content_hash BIGINT;
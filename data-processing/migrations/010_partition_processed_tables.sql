@@ -0,0 +1,91 @@
+-- Requires data-ingestion migration 005: it provides ensure_monthly_partitions/convert_to_monthly_partitions
+-- and drops the foreign keys and the materialized view when it partitions the raw tables
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('weather_ingestion_data')) IS DISTINCT FROM 'p' THEN
+        RAISE EXCEPTION 'Run the data-ingestion migrations first: weather_ingestion_data is not partitioned yet';
+    END IF;
+END;
+$$;
+
+-- The processed tables are partitioned on the same ingestion_timestamp as the raw rows they came from
+ALTER TABLE processed_weather_ingestion_data ADD COLUMN IF NOT EXISTS ingestion_timestamp BIGINT;
+UPDATE processed_weather_ingestion_data p SET ingestion_timestamp = w.ingestion_timestamp
+FROM weather_ingestion_data w WHERE w.uuid = p.ingestion_data_uuid AND p.ingestion_timestamp IS NULL;
+DELETE FROM processed_weather_ingestion_data WHERE ingestion_timestamp IS NULL;
+ALTER TABLE processed_weather_ingestion_data ALTER COLUMN ingestion_timestamp SET NOT NULL;
+
+ALTER TABLE processed_air_quality_ingestion_data ADD COLUMN IF NOT EXISTS ingestion_timestamp BIGINT;
+UPDATE processed_air_quality_ingestion_data p SET ingestion_timestamp = aq.ingestion_timestamp
+FROM air_quality_ingestion_data aq WHERE aq.uuid = p.ingestion_data_uuid AND p.ingestion_timestamp IS NULL;
+DELETE FROM processed_air_quality_ingestion_data WHERE ingestion_timestamp IS NULL;
+ALTER TABLE processed_air_quality_ingestion_data ALTER COLUMN ingestion_timestamp SET NOT NULL;
+
+SELECT convert_to_monthly_partitions('processed_weather_ingestion_data', ARRAY['ingestion_data_uuid', 'ingestion_timestamp']);
+SELECT convert_to_monthly_partitions('processed_air_quality_ingestion_data', ARRAY['ingestion_data_uuid', 'ingestion_timestamp']);
+SELECT convert_to_monthly_partitions('combined_processed_ingestion_data', ARRAY['uuid', 'ingestion_timestamp']);
+SELECT convert_to_monthly_partitions('combined_features', ARRAY['weather_ingestion_uuid', 'aq_ingestion_uuid', 'ingestion_timestamp']);
+
+-- Upsert targets of the processors
+CREATE UNIQUE INDEX IF NOT EXISTS combined_processed_ingestion_data_uuids
+    ON combined_processed_ingestion_data (weather_ingestion_uuid, aq_ingestion_uuid, ingestion_timestamp);
+
+-- Indexes from 006, now created on every partition
+CREATE INDEX IF NOT EXISTS combined_processed_ingestion_data_ts_idx
+    ON combined_processed_ingestion_data (ingestion_timestamp);
+
+CREATE INDEX IF NOT EXISTS combined_features_ts_idx
+    ON combined_features (ingestion_timestamp);
+
+-- From 005, over the partitioned raw tables
+CREATE MATERIALIZED VIEW IF NOT EXISTS combined_features_view AS
+SELECT
+    w.uuid AS weather_ingestion_uuid,
+    aq.uuid AS aq_ingestion_uuid,
+    w.ingestion_timestamp,
+    w.city_name,
+    -- Weather-kolumner
+    w.lat,
+    w.lon,
+    w.temp,
+    w.feels_like,
+    w.temp_min,
+    w.temp_max,
+    w.pressure,
+    w.humidity,
+    w.sea_level,
+    w.grnd_level,
+    w.visibility,
+    w.wind_speed,
+    w.wind_deg,
+    w.clouds,
+    w.weather_main,
+    w.weather_description,
+    w.sunrise,
+    w.sunset,
+    -- Air Quality-kolumner
+    aq.aqi,
+    aq.co,
+    aq.no,
+    aq.no2,
+    aq.o3,
+    aq.so2,
+    aq.pm2_5,
+    aq.pm10,
+    aq.nh3,
+    -- Derived features
+    (aq.aqi * w.humidity)::DOUBLE PRECISION / 100 AS pollution_weather_index,
+    w.temp / (aq.pm2_5 + 1) AS temp_pollution_ratio,
+    w.wind_speed / (aq.aqi + 1) AS wind_pollution_clearance,
+    aq.aqi + (w.humidity > 80)::INT + (w.wind_speed < 2)::INT + (w.clouds > 80)::INT AS environmental_stress,
+    EXTRACT(MONTH FROM to_timestamp(w.ingestion_timestamp / 1000.0) AT TIME ZONE 'UTC')::INT AS month,
+    EXTRACT(DAY FROM to_timestamp(w.ingestion_timestamp / 1000.0) AT TIME ZONE 'UTC')::INT AS day,
+    EXTRACT(YEAR FROM to_timestamp(w.ingestion_timestamp / 1000.0) AT TIME ZONE 'UTC')::INT AS year
+FROM weather_ingestion_data w
+JOIN air_quality_ingestion_data aq
+    ON w.city_name = aq.city_name
+   AND w.ingestion_timestamp = aq.ingestion_timestamp;
+
+-- Required for REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS combined_features_view_uuids
+    ON combined_features_view (weather_ingestion_uuid, aq_ingestion_uuid);
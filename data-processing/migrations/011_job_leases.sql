@@ -0,0 +1,6 @@
+-- Leases for running jobs: workers renew heartbeat_at while a job runs, and a job whose heartbeat has
+-- stopped is requeued by the next worker that polls. Shared with the ingestion service, like 007_processing_jobs.sql
+ALTER TABLE pipeline_jobs ADD COLUMN IF NOT EXISTS heartbeat_at BIGINT;
+
+CREATE INDEX IF NOT EXISTS pipeline_jobs_running_idx
+    ON pipeline_jobs (heartbeat_at) WHERE status = 'running';
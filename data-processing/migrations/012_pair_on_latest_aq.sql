@@ -0,0 +1,62 @@
+-- Pair each weather row with the city's latest AQ row stored at or before it, within
+-- CombinedDataProcessor.AQ_PAIRING_WINDOW_MS (3 hours), instead of the AQ row of the same ingestion.
+-- The natural keys drop an AQ row whose observation is already stored, and the weather API's dt moves
+-- more often than the air-quality API's, so equal ingestion timestamps lost those weather observations
+DROP MATERIALIZED VIEW IF EXISTS combined_features_view;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS combined_features_view AS
+SELECT
+    w.uuid AS weather_ingestion_uuid,
+    aq.uuid AS aq_ingestion_uuid,
+    w.ingestion_timestamp,
+    w.city_name,
+    -- Weather-kolumner
+    w.lat,
+    w.lon,
+    w.temp,
+    w.feels_like,
+    w.temp_min,
+    w.temp_max,
+    w.pressure,
+    w.humidity,
+    w.sea_level,
+    w.grnd_level,
+    w.visibility,
+    w.wind_speed,
+    w.wind_deg,
+    w.clouds,
+    w.weather_main,
+    w.weather_description,
+    w.sunrise,
+    w.sunset,
+    -- Air Quality-kolumner
+    aq.aqi,
+    aq.co,
+    aq.no,
+    aq.no2,
+    aq.o3,
+    aq.so2,
+    aq.pm2_5,
+    aq.pm10,
+    aq.nh3,
+    -- Derived features
+    (aq.aqi * w.humidity)::DOUBLE PRECISION / 100 AS pollution_weather_index,
+    w.temp / (aq.pm2_5 + 1) AS temp_pollution_ratio,
+    w.wind_speed / (aq.aqi + 1) AS wind_pollution_clearance,
+    aq.aqi + (w.humidity > 80)::INT + (w.wind_speed < 2)::INT + (w.clouds > 80)::INT AS environmental_stress,
+    EXTRACT(MONTH FROM to_timestamp(w.ingestion_timestamp / 1000.0) AT TIME ZONE 'UTC')::INT AS month,
+    EXTRACT(DAY FROM to_timestamp(w.ingestion_timestamp / 1000.0) AT TIME ZONE 'UTC')::INT AS day,
+    EXTRACT(YEAR FROM to_timestamp(w.ingestion_timestamp / 1000.0) AT TIME ZONE 'UTC')::INT AS year
+FROM weather_ingestion_data w
+JOIN LATERAL (
+    SELECT * FROM air_quality_ingestion_data a
+    WHERE a.city_name = w.city_name
+      AND a.ingestion_timestamp <= w.ingestion_timestamp
+      AND a.ingestion_timestamp > w.ingestion_timestamp - 10800000
+    ORDER BY a.ingestion_timestamp DESC
+    LIMIT 1
+) aq ON true;
+
+-- Required for REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS combined_features_view_uuids
+    ON combined_features_view (weather_ingestion_uuid, aq_ingestion_uuid);
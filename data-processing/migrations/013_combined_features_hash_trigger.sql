@@ -0,0 +1,19 @@
+-- combined_features is written by both CombinedDataProcessor.save_features (pandas) and refresh_view (SQL).
+-- Its content_hash is computed here for both, so a row written by one path is a no-op for the other.
+-- Everything but the key uuids is hashed, from the stored (typed) values. Rows hashed under the old
+-- definitions are rewritten once, the next time either path writes them
+CREATE OR REPLACE FUNCTION combined_features_content_hash() RETURNS trigger AS $$
+BEGIN
+    NEW.content_hash := hashtextextended(
+        (to_jsonb(NEW) - 'weather_ingestion_uuid' - 'aq_ingestion_uuid' - 'content_hash')::text, 0
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- On the partitioned table, so every partition, including ones ensure_monthly_partitions creates later, gets it.
+-- The upserts' EXCLUDED row already carries the hash set by the BEFORE INSERT trigger
+DROP TRIGGER IF EXISTS combined_features_content_hash ON combined_features;
+CREATE TRIGGER combined_features_content_hash
+    BEFORE INSERT OR UPDATE ON combined_features
+    FOR EACH ROW EXECUTE FUNCTION combined_features_content_hash();
@@ -1,4 +1,5 @@
 from .DataProcessor import DataProcessor
+from .ConnectionPool import ConnectionPool
 from typing import TypedDict
 import pandas as pd
 from time import time
@@ -18,6 +19,7 @@ class UnProcessedData(TypedDict):
     pm10: float
     nh3: float
     ingestion_timestamp: int
+    observation_timestamp: int | None
     data_source: str
 
 
@@ -26,15 +28,39 @@ class AirQualityDataProcessor(DataProcessor):
 
     unprocessed_data: UnProcessedData | None = None
     processed_data: pd.DataFrame | None = None
+    watermark_key = "air_quality"
+    schema = UnProcessedData
 
-    def __init__(self, timestamp: int = int(datetime.datetime.now(tz=datetime.UTC).timestamp() * 1000)):
-        super().__init__()
+    def __init__(self, timestamp: int = int(datetime.datetime.now(tz=datetime.UTC).timestamp() * 1000), pool: ConnectionPool | None = None, full_rebuild: bool = False, ingestion_timestamp: int | None = None, shard: tuple[int, int] | None = None):
+        super().__init__(pool, full_rebuild, ingestion_timestamp, shard)
         self.timestamp = timestamp
 
 
+    def fetch_query(self, ascending: bool = False) -> tuple[str, tuple]:
+        order = "ASC" if ascending else "DESC"
+        shard, shard_params = self.shard_filter("src.city_name")
+        if self.full_rebuild:
+            return f"SELECT * FROM air_quality_ingestion_data src WHERE true {shard} ORDER BY ingestion_timestamp {order};", shard_params
+        if self.ingestion_timestamp is not None:
+            since, condition = self.ingestion_timestamp, "="
+        else:
+            since, condition = self.fetch_since(), ">="
+        # Only rows past the watermark (or of the given batch) that have no processed entry yet
+        return f"""
+            SELECT src.* FROM air_quality_ingestion_data src
+            WHERE src.ingestion_timestamp {condition} %s
+              AND NOT EXISTS (
+                  SELECT 1 FROM processed_air_quality_ingestion_data p
+                  WHERE p.ingestion_data_uuid = src.uuid
+                    AND p.ingestion_timestamp = src.ingestion_timestamp
+              )
+              {shard}
+            ORDER BY src.ingestion_timestamp {order};
+        """, (since, *shard_params)
+
     def fetch_data(self) -> "AirQualityDataProcessor":
         cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM air_quality_ingestion_data ORDER BY ingestion_timestamp DESC;")
+        cursor.execute(*self.fetch_query())
         rows = cursor.fetchall()
         columns = [desc[0] for desc in cursor.description]
         data = [dict(zip(columns, row)) for row in rows]
@@ -43,55 +69,54 @@ class AirQualityDataProcessor(DataProcessor):
         return self
 
     def process_data(self) -> "AirQualityDataProcessor":
-        if not self.unprocessed_data:
+        if self.unprocessed_data is None or len(self.unprocessed_data) == 0:
             raise ValueError("No data to process. Fetch data first.")
-        df = pd.DataFrame(self.unprocessed_data)
-        df = pd.get_dummies(columns=["city_name"] , data=df, drop_first=True, dtype=int)
+        df = self.to_frame(self.unprocessed_data)
+        df = self.encode_categories(df, ["city_name"])
         
-        df["month"] = pd.to_datetime(df["ingestion_timestamp"], unit="ms").dt.month
-        df["day"] = pd.to_datetime(df["ingestion_timestamp"], unit="ms").dt.day
-        df["year"] = pd.to_datetime(df["ingestion_timestamp"], unit="ms").dt.year
-        df.drop_duplicates(inplace=True)
+        df = self.add_date_parts(df)
         self.processed_data = df
         return self    
 
-    def save_data(self) -> "AirQualityDataProcessor":
+    def save_data(self, return_rows: bool = True) -> "AirQualityDataProcessor":
         if self.processed_data is None or self.processed_data.empty:
             raise ValueError("No data to save. Process data first.")
 
-        cursor = self.conn.cursor()
-
         self.processed_data.drop(columns=["data_source"], inplace=True, errors='ignore')
         self.processed_data.columns = self.processed_data.columns.str.replace(" ", "_")
         
         insert_query = """
         INSERT INTO processed_air_quality_ingestion_data (
             ingestion_data_uuid,
+            ingestion_timestamp,
             json_data,
-            processed_timestamp
-        ) VALUES (%s, %s, %s)
-        ON CONFLICT (ingestion_data_uuid) DO UPDATE
+            processed_timestamp,
+            content_hash
+        ) VALUES %s
+        ON CONFLICT (ingestion_data_uuid, ingestion_timestamp) DO UPDATE
         SET json_data = EXCLUDED.json_data,
-            processed_timestamp = EXCLUDED.processed_timestamp
-        RETURNING json_build_object(
+            processed_timestamp = EXCLUDED.processed_timestamp,
+            content_hash = EXCLUDED.content_hash
+        WHERE processed_air_quality_ingestion_data.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+        """
+        returning = """json_build_object(
             'ingestion_data_uuid', ingestion_data_uuid,
             'json_data', json_data,
             'processed_timestamp', processed_timestamp
-        );
-        """
-        res = []
-        for _, row in self.processed_data.iterrows():
-            d_row = row.drop(labels=["uuid", "ingestion_timestamp"])
-            values = (
-                row["uuid"],
-                d_row.to_json(),
-                self.timestamp
+        )"""
+
+        # Serialize the whole frame in one call, one JSON document per line
+        content = self.for_storage(self.processed_data.drop(columns=["uuid", "ingestion_timestamp"]))
+        json_rows = content.to_json(orient="records", lines=True).splitlines()
+        rows = [
+            (uuid, ingestion_timestamp, json_row, self.timestamp, content_hash)
+            for uuid, ingestion_timestamp, json_row, content_hash in zip(
+                self.processed_data["uuid"].tolist(), self.processed_data["ingestion_timestamp"].tolist(), json_rows, self.content_hashes(content)
             )
-            cursor.execute(insert_query, values)
-            res.append(cursor.fetchone())
-        
+        ]
+        res, counts = self.upsert_rows(insert_query, rows, returning if return_rows else None)
 
-        self.result = res
+        self.result = res if return_rows else {"saved": len(rows), **counts}
+        self.advance_watermark(int(self.processed_data["ingestion_timestamp"].max()))
         self.conn.commit()
-        cursor.close()
         return self
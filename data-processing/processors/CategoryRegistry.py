@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+from .ConnectionPool import ConnectionPool, get_pool
+
+class CategoryRegistry:
+    """Append-only, persisted category -> index mapping shared by all processors"""
+    vocabulary: dict[str, list[str]]
+
+    def __init__(self, conn: psycopg2.extensions.connection, pool: ConnectionPool | None = None):
+        self.conn = conn
+        # New categories are committed on their own connection, never in the caller's transaction
+        self.pool = pool or get_pool()
+        self.vocabulary = {}
+
+    def categories(self, column: str) -> list[str]:
+        """Categories for a column in index order"""
+        if column not in self.vocabulary:
+            self.vocabulary[column] = self._read(self.conn, column)
+        return self.vocabulary[column]
+
+    def _read(self, conn: psycopg2.extensions.connection, column: str) -> list[str]:
+        cursor = conn.cursor()
+        cursor.execute("SELECT category FROM category_vocabulary WHERE column_name = %s ORDER BY idx;", (column,))
+        categories = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        return categories
+
+    def register(self, column: str, values) -> list[str]:
+        """Append unseen values with the next free indices and return the column's vocabulary"""
+        known = set(self.categories(column))
+        if not any(v not in known for v in values):
+            return self.vocabulary[column]
+
+        # A separate pooled connection: committing here must not commit or end the caller's transaction,
+        # which may hold its own locks and half-written rows
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            # Serialise writers per column, then re-read so indices never collide
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext('category_vocabulary'), hashtext(%s));", (column,))
+            vocab = self._read(conn, column)
+            known = set(vocab)
+            new = sorted({v for v in values if v not in known})
+            execute_values(
+                cursor,
+                "INSERT INTO category_vocabulary (column_name, category, idx) VALUES %s;",
+                [(column, category, len(vocab) + i) for i, category in enumerate(new)]
+            )
+            cursor.close()
+
+        vocab.extend(new)
+        self.vocabulary[column] = vocab
+        return vocab
+
+    def one_hot(self, df: pd.DataFrame, columns: list[str], dtype=np.uint8, sparse: bool = False) -> pd.DataFrame:
+        """Fixed-width one-hot encoding; the baseline dropped is always the category with index 0"""
+        for column in columns:
+            vocab = self.register(column, df[column].dropna().unique().tolist())
+            df[column] = pd.Categorical(df[column], categories=vocab)
+        return pd.get_dummies(data=df, columns=columns, drop_first=True, dtype=dtype, sparse=sparse)
+
+    def codes(self, df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+        """Replace each column with <column>_code holding the category's vocabulary index"""
+        for column in columns:
+            vocab = self.register(column, df[column].dropna().unique().tolist())
+            df[f"{column}_code"] = pd.Categorical(df[column], categories=vocab).codes.astype(np.int16)
+        return df.drop(columns=columns)
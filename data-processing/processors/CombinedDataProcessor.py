@@ -1,5 +1,10 @@
-from .DataProcessor import DataProcessor
+from .DataProcessor import DataProcessor, FETCH_CHUNK_SIZE
+from .ConnectionPool import ConnectionPool
+import os
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from time import time
 from typing import TypedDict
 import json
@@ -40,27 +45,66 @@ class UnProcessedData(TypedDict):
     pm10: float
     nh3: float
 
+# "json" (combined_processed_ingestion_data), "columnar" (combined_features) or "both"
+FEATURE_STORAGE = os.getenv("FEATURE_STORAGE", "both")
+
+CATEGORICAL_COLUMNS = ["weather_main", "weather_description", "city_name"]
+
+# A weather row pairs with the city's latest AQ row stored at most this long before it; the same bound is
+# in combined_features_view (migrations/012_pair_on_latest_aq.sql)
+AQ_PAIRING_WINDOW_MS = 3 * 3_600_000
+
+# NOTIFY channel for the ML service once new combined rows are committed
+COMBINED_CHANNEL = "combined_processed"
+
+# Column order of the typed combined_features table
+FEATURE_COLUMNS = [
+    "weather_ingestion_uuid", "aq_ingestion_uuid", "ingestion_timestamp",
+    "lat", "lon", "temp", "feels_like", "temp_min", "temp_max",
+    "pressure", "humidity", "sea_level", "grnd_level", "visibility",
+    "wind_speed", "wind_deg", "clouds", "sunrise", "sunset",
+    "aqi", "co", "no", "no2", "o3", "so2", "pm2_5", "pm10", "nh3",
+    "pollution_weather_index", "temp_pollution_ratio", "wind_pollution_clearance", "environmental_stress",
+    "month", "day", "year",
+    "weather_main_code", "weather_description_code", "city_name_code",
+]
+
 class CombinedDataProcessor(DataProcessor):
     unprocessed_data: list[UnProcessedData] = []
     weather_df: pd.DataFrame | None = None
     aq_df: pd.DataFrame | None = None
     processed_data: pd.DataFrame | None = None
+    category_codes: pd.DataFrame | None = None
+    feature_counts: dict = {}
+    schema = UnProcessedData
 
-    def __init__(self, timestamp: int = int(datetime.datetime.now(tz=datetime.UTC).timestamp() * 1000)):
-        super().__init__()
+    def __init__(self, timestamp: int = int(datetime.datetime.now(tz=datetime.UTC).timestamp() * 1000), pool: ConnectionPool | None = None, feature_storage: str = FEATURE_STORAGE, full_rebuild: bool = False, ingestion_timestamp: int | None = None, shard: tuple[int, int] | None = None):
+        super().__init__(pool, full_rebuild, ingestion_timestamp, shard)
         self.timestamp = timestamp
+        self.feature_storage = feature_storage
 
 
-    def fetch_data(self) -> "CombinedDataProcessor":
-        cursor = self.conn.cursor()
-        cursor.execute("""
+    def fetch_query(self, ascending: bool = False) -> tuple[str, tuple]:
+        order = "ASC" if ascending else "DESC"
+        batch, batch_params = ("AND w.ingestion_timestamp = %s", (self.ingestion_timestamp,)) if self.ingestion_timestamp is not None else ("", ())
+        shard, shard_params = self.shard_filter("w.city_name")
+        # Only pairs missing from a table this run writes to; there is no watermark, the key lookups are the filter
+        sinks = {"json": ["combined_processed_ingestion_data"], "columnar": ["combined_features"]}.get(
+            self.feature_storage, ["combined_processed_ingestion_data", "combined_features"]
+        )
+        missing = "" if self.full_rebuild else "AND (" + " OR ".join(f"""NOT EXISTS (
+                SELECT 1 FROM {sink} c
+                WHERE c.weather_ingestion_uuid = w.uuid
+                  AND c.aq_ingestion_uuid = aq.uuid
+                  AND c.ingestion_timestamp = w.ingestion_timestamp
+            )""" for sink in sinks) + ")"
+        return f"""
             SELECT
                 w.city_name,
                 w.ingestion_timestamp,
                 w.uuid AS weather_ingestion_uuid,
                 aq.uuid AS aq_ingestion_uuid,
 
-                w.ingestion_timestamp,
                 -- Weather-kolumner
                 w.lat,
                 w.lon,
@@ -92,11 +136,23 @@ class CombinedDataProcessor(DataProcessor):
                 aq.nh3
 
             FROM weather_ingestion_data w
-            JOIN air_quality_ingestion_data aq
-                ON w.city_name = aq.city_name
-               AND w.ingestion_timestamp = aq.ingestion_timestamp
-            ORDER BY w.ingestion_timestamp DESC;
-        """)
+            -- The city's latest stored AQ observation as of the weather row: an ingestion whose AQ row was
+            -- skipped as a duplicate pairs with the row it duplicated; see migrations/012_pair_on_latest_aq.sql
+            JOIN LATERAL (
+                SELECT * FROM air_quality_ingestion_data a
+                WHERE a.city_name = w.city_name
+                  AND a.ingestion_timestamp <= w.ingestion_timestamp
+                  AND a.ingestion_timestamp > w.ingestion_timestamp - {AQ_PAIRING_WINDOW_MS}
+                ORDER BY a.ingestion_timestamp DESC
+                LIMIT 1
+            ) aq ON true
+            WHERE true {batch} {missing} {shard}
+            ORDER BY w.ingestion_timestamp {order};
+        """, (*batch_params, *shard_params)
+
+    def fetch_data(self) -> "CombinedDataProcessor":
+        cursor = self.conn.cursor()
+        cursor.execute(*self.fetch_query())
         rows = cursor.fetchall()
         columns = [desc[0] for desc in cursor.description]
         data = [dict(zip(columns, row)) for row in rows]
@@ -108,24 +164,29 @@ class CombinedDataProcessor(DataProcessor):
         if len(self.unprocessed_data) == 0:
            raise ValueError("No data to process. Fetch data first.")
 
-        merged_df = pd.DataFrame(self.unprocessed_data)
+        merged_df = self.to_frame(self.unprocessed_data)
 
-        merged_df["pollution_weather_index"] = (merged_df["aqi"] * merged_df["humidity"] / 100)
+        # Derived features are computed and kept in float64 whatever the compact dtypes are, so they match the default mode;
+        # for_storage widens float32 inputs through the shortest repr, so 59.3293 stays 59.3293
+        wide = self.for_storage(merged_df[["aqi", "humidity", "temp", "pm2_5", "wind_speed"]]).astype(np.float64)
+
+        merged_df["pollution_weather_index"] = (wide["aqi"] * wide["humidity"] / 100)
 
         # Temperature-pollution correlation
-        merged_df["temp_pollution_ratio"] = merged_df["temp"] / (merged_df["pm2_5"] + 1)
+        merged_df["temp_pollution_ratio"] = wide["temp"] / (wide["pm2_5"] + 1)
 
         # Wind effect on pollution
-        merged_df["wind_pollution_clearance"] = merged_df["wind_speed"] / (merged_df["aqi"] + 1)
+        merged_df["wind_pollution_clearance"] = wide["wind_speed"] / (wide["aqi"] + 1)
 
         # Weather severity with pollution
         merged_df["environmental_stress"] = (merged_df["aqi"] + (merged_df["humidity"] > 80).astype(int) + (merged_df["wind_speed"] < 2).astype(int) + (merged_df["clouds"] > 80).astype(int))
 
-        merged_df = pd.get_dummies(data=merged_df, columns=["weather_main", "weather_description", "city_name"], drop_first=True, dtype=int)
+        # The typed feature table always stores integer codes, whatever the JSON encoding is
+        if self.feature_storage != "json" and self.category_encoding != "codes":
+            self.category_codes = self.categories.codes(merged_df[CATEGORICAL_COLUMNS].copy(), CATEGORICAL_COLUMNS)
+        merged_df = self.encode_categories(merged_df, CATEGORICAL_COLUMNS)
 
-        merged_df["month"] = pd.to_datetime(merged_df["ingestion_timestamp"], unit="ms").dt.month
-        merged_df["day"] = pd.to_datetime(merged_df["ingestion_timestamp"], unit="ms").dt.day
-        merged_df["year"] = pd.to_datetime(merged_df["ingestion_timestamp"], unit="ms").dt.year
+        merged_df = self.add_date_parts(merged_df)
         
 
 
@@ -135,42 +196,130 @@ class CombinedDataProcessor(DataProcessor):
         return self    
 
 
-    def save_data(self) -> "CombinedDataProcessor":
-        res = []
+    def save_data(self, return_rows: bool = True) -> "CombinedDataProcessor":
+        if self.feature_storage != "json":
+            self.save_features()
+        self.notify_processed()
+        if self.feature_storage == "columnar":
+            self.conn.commit()
+            self.result = {"saved": len(self.processed_data), **self.feature_counts}
+            return self
+
         insert_query = """
             INSERT INTO combined_processed_ingestion_data
-                (weather_ingestion_uuid, aq_ingestion_uuid, json_data, ingestion_timestamp)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (weather_ingestion_uuid, aq_ingestion_uuid) DO UPDATE
+                (weather_ingestion_uuid, aq_ingestion_uuid, json_data, ingestion_timestamp, content_hash)
+            VALUES %s
+            ON CONFLICT (weather_ingestion_uuid, aq_ingestion_uuid, ingestion_timestamp) DO UPDATE
                 SET json_data = EXCLUDED.json_data,
-                    ingestion_timestamp = EXCLUDED.ingestion_timestamp
-                WHERE combined_processed_ingestion_data.uuid IS DISTINCT FROM EXCLUDED.uuid
-            RETURNING json_build_object(
+                    content_hash = EXCLUDED.content_hash
+                WHERE combined_processed_ingestion_data.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+        """
+        returning = """json_build_object(
                 'weather_ingestion_uuid', weather_ingestion_uuid,
                 'aq_ingestion_uuid', aq_ingestion_uuid,
                 'json_data', json_data,
                 'ingestion_timestamp', ingestion_timestamp
-            );
-        """
+            )"""
 
-        
+        # Serialize the whole frame in one call, one JSON document per line
+        key_columns = ["weather_ingestion_uuid", "aq_ingestion_uuid", "ingestion_timestamp"]
+        content = self.for_storage(self.processed_data.drop(columns=key_columns))
+        json_rows = content.to_json(orient="records", lines=True).splitlines()
+        rows = [
+            (weather_uuid, aq_uuid, json_row, ingestion_timestamp, content_hash)
+            for (weather_uuid, aq_uuid, ingestion_timestamp), json_row, content_hash
+            in zip(self.processed_data[key_columns].itertuples(index=False, name=None), json_rows, self.content_hashes(content))
+        ]
+        res, counts = self.upsert_rows(insert_query, rows, returning if return_rows else None)
+
+        self.conn.commit()
+        self.result = res if return_rows else {"saved": len(rows), **counts, **self.feature_counts}
+        return self
 
+    def notify_processed(self):
+        timestamps = self.processed_data["ingestion_timestamp"]
+        self.notify(COMBINED_CHANNEL, {
+            "rows": len(self.processed_data),
+            "min_ingestion_timestamp": int(timestamps.min()),
+            "max_ingestion_timestamp": int(timestamps.max()),
+        })
+
+    def refresh_view(self) -> "CombinedDataProcessor":
+        """Recompute the derived features inside Postgres and load them into combined_features, so the
+        columnar trainer sees them without a pass through pandas; readers are not blocked during the refresh"""
         cursor = self.conn.cursor()
-        for _, row in self.processed_data.iterrows():
-            d_row = row.drop(labels=["weather_ingestion_uuid", "aq_ingestion_uuid", "ingestion_timestamp"])
-            cursor.execute(
-                insert_query,
-                (
-                    row["weather_ingestion_uuid"],
-                    row["aq_ingestion_uuid"],
-                    d_row.to_json(),
-                    row["ingestion_timestamp"]
-                )
-            )
-            res.append(cursor.fetchone())
-        
+        cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY combined_features_view;")
+        cursor.execute("SELECT COUNT(*) FROM combined_features_view;")
+        rows = cursor.fetchone()[0]
 
+        # Every category needs an index before the join below can turn it into a code
+        for column in CATEGORICAL_COLUMNS:
+            cursor.execute(f"SELECT DISTINCT {column} FROM combined_features_view WHERE {column} IS NOT NULL;")
+            self.categories.register(column, [row[0] for row in cursor.fetchall()])
+
+        values = [f"v.{c}" for c in FEATURE_COLUMNS if not c.endswith("_code")] + [f"{c}_vocab.idx" for c in CATEGORICAL_COLUMNS]
+        joins = "\n".join(
+            f"LEFT JOIN category_vocabulary {c}_vocab ON {c}_vocab.column_name = '{c}' AND {c}_vocab.category = v.{c}"
+            for c in CATEGORICAL_COLUMNS
+        )
+        # content_hash is set by a trigger, the same one save_features() relies on; see migrations/013
+        cursor.execute(f"""
+            INSERT INTO combined_features ({", ".join(FEATURE_COLUMNS)})
+            SELECT {", ".join(values)}
+            FROM combined_features_view v
+            {joins}
+            ON CONFLICT (weather_ingestion_uuid, aq_ingestion_uuid, ingestion_timestamp) DO UPDATE
+                SET {", ".join(f"{c} = EXCLUDED.{c}" for c in FEATURE_COLUMNS[3:])}
+                WHERE combined_features.content_hash IS DISTINCT FROM EXCLUDED.content_hash;
+        """)
+        written = cursor.rowcount
+
+        self.notify(COMBINED_CHANNEL, {"rows": rows})
         self.conn.commit()
         cursor.close()
-        self.result = res
+        self.result = {"refreshed": "combined_features_view", "rows": rows, "features_written": written}
         return self
+
+    def save_features(self) -> "CombinedDataProcessor":
+        """Upsert into the typed combined_features table; committed together with save_data"""
+        df = self.processed_data
+        if self.category_codes is not None:
+            df = df.join(self.category_codes)
+
+        # content_hash is set by a trigger from the stored values, so refresh_view() hashes rows the same way;
+        # see migrations/013_combined_features_hash_trigger.sql
+        insert_query = f"""
+            INSERT INTO combined_features ({", ".join(FEATURE_COLUMNS)})
+            VALUES %s
+            ON CONFLICT (weather_ingestion_uuid, aq_ingestion_uuid, ingestion_timestamp) DO UPDATE
+                SET {", ".join(f"{c} = EXCLUDED.{c}" for c in FEATURE_COLUMNS[3:])}
+                WHERE combined_features.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+        """
+        features = self.for_storage(df[FEATURE_COLUMNS])
+        _, counts = self.upsert_rows(insert_query, list(features.itertuples(index=False, name=None)))
+        self.feature_counts = {f"features_{key}": value for key, value in counts.items()}
+        return self
+
+    def export_parquet(self, path: str, chunk_size: int = FETCH_CHUNK_SIZE) -> str:
+        """Stream combined_features into a Parquet file, one row group per chunk"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        cursor = self.conn.cursor(name="combined_features_export")
+        cursor.itersize = chunk_size
+        cursor.execute(f"SELECT {', '.join(FEATURE_COLUMNS)} FROM combined_features ORDER BY ingestion_timestamp;")
+
+        writer = None
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                table = pa.Table.from_pandas(pd.DataFrame.from_records(rows, columns=FEATURE_COLUMNS), preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+            cursor.close()
+            self.conn.rollback()
+        return path
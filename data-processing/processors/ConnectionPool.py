@@ -0,0 +1,143 @@
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from time import time
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Connections idle for longer than this are pinged before being handed out
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30"))
+
+class ConnectionPool:
+    """Thread-safe Postgres connection pool with blocking, health-checked checkout"""
+    minconn: int
+    maxconn: int
+
+    def __init__(self, dsn: str | None = None, minconn: int | None = None, maxconn: int | None = None, timeout: float | None = None):
+        self.minconn = minconn if minconn is not None else DB_POOL_MIN
+        self.maxconn = max(self.minconn, maxconn if maxconn is not None else DB_POOL_MAX, 1)
+        self.timeout = timeout if timeout is not None else DB_POOL_TIMEOUT
+        self._pool = ThreadedConnectionPool(self.minconn, self.maxconn, dsn or os.getenv("DATABASE_URL"))
+        # psycopg2's pool raises when exhausted; the semaphore makes callers wait instead
+        self._slots = threading.BoundedSemaphore(self.maxconn)
+        self._lock = threading.Lock()
+        self._last_used: dict[int, float] = {}
+        self._stats = {
+            "checkouts": 0,
+            "in_use": 0,
+            "discarded": 0,
+            "timeouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def getconn(self) -> psycopg2.extensions.connection:
+        start = time()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise PoolError(f"No database connection available within {self.timeout}s")
+
+        try:
+            conn = self._pool.getconn()
+            if not self._is_healthy(conn):
+                logger.warning("[Pool]: Discarding unhealthy database connection")
+                self._discard(conn)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        waited = time() - start
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["in_use"] += 1
+            self._stats["wait_seconds_total"] += waited
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+        return conn
+
+    def putconn(self, conn: psycopg2.extensions.connection):
+        try:
+            if conn.closed:
+                self._discard(conn)
+                return
+            # Never hand an open transaction to the next borrower
+            if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            self._last_used[id(conn)] = time()
+            self._pool.putconn(conn)
+        except psycopg2.Error:
+            self._discard(conn)
+        finally:
+            with self._lock:
+                self._stats["in_use"] -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection; commits on success, rolls back on error and always returns it"""
+        conn = self.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.putconn(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["idle"] = len(self._pool._pool)
+        stats["size"] = stats["idle"] + len(self._pool._used)
+        stats["min_size"] = self.minconn
+        stats["max_size"] = self.maxconn
+        stats["wait_seconds_avg"] = stats["wait_seconds_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        return stats
+
+    def close(self):
+        self._pool.closeall()
+
+    def _is_healthy(self, conn: psycopg2.extensions.connection) -> bool:
+        if conn.closed:
+            return False
+        if time() - self._last_used.get(id(conn), 0) < DB_POOL_HEALTH_CHECK_INTERVAL:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn: psycopg2.extensions.connection):
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+        with self._lock:
+            self._stats["discarded"] += 1
+
+
+_pool: ConnectionPool | None = None
+_pool_pid: int | None = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Process-wide default pool; recreated after a fork so children never share sockets"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ConnectionPool()
+            _pool_pid = os.getpid()
+        return _pool
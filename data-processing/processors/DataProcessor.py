@@ -1,12 +1,250 @@
 from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from typing import Callable, ContextManager, Iterator, get_type_hints
+import json
+import numpy as np
+import pandas as pd
 import psycopg2
+from psycopg2.extras import execute_values
 import os
+from .ConnectionPool import ConnectionPool, get_pool
+from .CategoryRegistry import CategoryRegistry
+
+# Incremental runs re-check this far behind the watermark to pick up rows committed late
+WATERMARK_LOOKBACK_MS = int(os.getenv("WATERMARK_LOOKBACK_MS", str(60 * 60 * 1000)))
+# Rows per multi-row statement in bulk upserts
+SAVE_BATCH_SIZE = int(os.getenv("SAVE_BATCH_SIZE", "5000"))
+# Rows per chunk when streaming from a server-side cursor
+FETCH_CHUNK_SIZE = int(os.getenv("FETCH_CHUNK_SIZE", "50000"))
+# "onehot" for fixed-width dummy columns, "codes" for one integer column per category
+CATEGORY_ENCODING = os.getenv("CATEGORY_ENCODING", "onehot")
+# Memory-optimized frames: schema-derived float32/small-int/category dtypes instead of float64/int64/object
+COMPACT_DTYPES = os.getenv("COMPACT_DTYPES", "false").lower() == "true"
+# Sparse one-hot columns; mostly useful with many categories, e.g. thousands of cities
+SPARSE_DUMMIES = os.getenv("SPARSE_DUMMIES", "false").lower() == "true"
+
+# Columns that keep their inferred 64-bit dtype in compact frames: epoch values and unique ids
+WIDE_COLUMNS = {"ingestion_timestamp", "observation_timestamp", "combined_timestamp", "timestamp", "sunrise", "sunset", "uuid", "weather_ingestion_uuid", "aq_ingestion_uuid"}
+
+def sum_counts(results: list[dict]) -> dict:
+    """Add up the write counts of several runs, chunks or shards"""
+    totals = {}
+    for result in results:
+        for key, value in result.items():
+            if isinstance(value, int):
+                totals[key] = totals.get(key, 0) + value
+    return totals
 
 class DataProcessor(ABC):
-    conn: psycopg2.extensions.connection
-    def __init__(self):
-        self.conn = psycopg2.connect(os.getenv("DATABASE_URL"))
+    conn: psycopg2.extensions.connection | None
+    pool: ConnectionPool
+    watermark_key: str | None = None
+    full_rebuild: bool
+    ingestion_timestamp: int | None
+    shard: tuple[int, int] | None
+    high_water_mark: int | None = None
+    categories: CategoryRegistry
+    category_encoding: str = CATEGORY_ENCODING
+    # The subclass's UnProcessedData TypedDict, used to derive compact dtypes
+    schema: type | None = None
+    compact_dtypes: bool = COMPACT_DTYPES
+    sparse_dummies: bool = SPARSE_DUMMIES
+    result: list = []
+
+    def __init__(self, pool: ConnectionPool | None = None, full_rebuild: bool = False, ingestion_timestamp: int | None = None, shard: tuple[int, int] | None = None):
+        self.pool = pool or get_pool()
+        self.conn = self.pool.getconn()
+        self.full_rebuild = full_rebuild
+        # Restricts the run to one ingestion batch, e.g. the one announced by an ingestion_saved notification
+        self.ingestion_timestamp = ingestion_timestamp
+        # (index, count): only the cities that hash to this shard, see tasks.run_partitioned
+        self.shard = tuple(shard) if shard else None
+        self.categories = CategoryRegistry(self.conn, self.pool)
+
+    def close(self):
+        if self.conn is not None:
+            self.pool.putconn(self.conn)
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(self, return_rows: bool = True, chunk_size: int | None = None, stage: Callable[[str], ContextManager] | None = None) -> "DataProcessor":
+        """Fetch, process and save; a run that finds nothing new is a no-op. stage(name) wraps each step, e.g. for timings"""
+        stage = stage or (lambda name: nullcontext())
+        if chunk_size:
+            return self.run_streaming(chunk_size, return_rows, stage)
+        with stage("fetch"):
+            self.fetch_data()
+        if len(self.unprocessed_data) == 0:
+            self.result = []
+            return self
+        with stage("process"):
+            self.process_data()
+        with stage("save"):
+            self.save_data(return_rows)
+        return self
+
+    def run_streaming(self, chunk_size: int = FETCH_CHUNK_SIZE, return_rows: bool = False, stage: Callable[[str], ContextManager] | None = None) -> "DataProcessor":
+        """Process and save one chunk at a time so peak memory is bounded by chunk_size"""
+        stage = stage or (lambda name: nullcontext())
+        results = []
+        counts = []
+        for chunk in self.fetch_chunks(chunk_size):
+            self.unprocessed_data = chunk
+            with stage("process"):
+                self.process_data()
+            with stage("save"):
+                self.save_data(return_rows)
+            if return_rows:
+                results.extend(self.result)
+            else:
+                counts.append(self.result)
+            self.processed_data = None
+
+        self.unprocessed_data = None
+        self.result = results if return_rows else {"saved": 0, **sum_counts(counts)}
+        return self
+
+    def fetch_chunks(self, chunk_size: int = FETCH_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+        """Stream fetch_query() through a named server-side cursor, one DataFrame per chunk"""
+        # Oldest first, so the watermark only moves forward as chunks are committed
+        query, params = self.fetch_query(ascending=True)
+        # WITH HOLD keeps the cursor open across the commit in each save_data()
+        cursor = self.conn.cursor(name=f"{type(self).__name__.lower()}_stream", withhold=True)
+        cursor.itersize = chunk_size
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                columns = [desc[0] for desc in cursor.description]
+                yield pd.DataFrame.from_records(rows, columns=columns)
+        finally:
+            cursor.close()
+
+    def to_frame(self, data) -> pd.DataFrame:
+        """Fetched rows as a DataFrame, with compact dtypes when enabled"""
+        df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+        if not self.compact_dtypes or self.schema is None:
+            return df
+        for column, kind in get_type_hints(self.schema).items():
+            if column not in df.columns or column in WIDE_COLUMNS:
+                continue
+            if kind is str:
+                df[column] = df[column].astype("category")
+            elif kind in (int, float):
+                # Downcasting only picks a dtype that holds every value; integer columns with nulls stay floating point
+                df[column] = pd.to_numeric(df[column], downcast="integer" if kind is int else "float")
+                if df[column].dtype == np.int8:
+                    # int16 floor so products like aqi * humidity cannot wrap around
+                    df[column] = df[column].astype(np.int16)
+                elif df[column].dtype == np.float64:
+                    df[column] = pd.to_numeric(df[column], downcast="float")
+        return df
+
+    def add_date_parts(self, df: pd.DataFrame, column: str = "ingestion_timestamp") -> pd.DataFrame:
+        """month, day and year of an epoch-millisecond column, converted once"""
+        dates = pd.to_datetime(df[column], unit="ms").dt
+        df["month"] = dates.month
+        df["day"] = dates.day
+        df["year"] = dates.year
+        if self.compact_dtypes:
+            df = df.astype({"month": np.int8, "day": np.int8, "year": np.int16})
+        return df
+
+    def encode_categories(self, df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+        """Encode categoricals against the shared vocabulary so every batch gets the same columns"""
+        if self.category_encoding == "codes":
+            return self.categories.codes(df, columns)
+        return self.categories.one_hot(df, columns, sparse=self.sparse_dummies)
+
+    def for_storage(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Undo the in-memory compaction before serializing, so stored values do not depend on the mode"""
+        sparse = [c for c, dtype in df.dtypes.items() if isinstance(dtype, pd.SparseDtype)]
+        if sparse:
+            df = df.astype({c: df[c].dtype.subtype for c in sparse})
+        # float32 -> float64 through the shortest repr, so 59.3293 is stored as 59.3293 and not 59.32929992675781
+        narrow = [c for c, dtype in df.dtypes.items() if dtype == np.float32]
+        if narrow:
+            df = df.astype({c: str for c in narrow}).astype({c: np.float64 for c in narrow})
+        return df
+
+    def content_hashes(self, df: pd.DataFrame) -> list[int]:
+        """One signed 64-bit hash per row; df should already be in its for_storage form"""
+        hashes = pd.util.hash_pandas_object(df, index=False)
+        return hashes.to_numpy().view(np.int64).tolist()
+
+    def upsert_rows(self, query: str, rows: list[tuple], returning: str | None = None) -> tuple[list, dict]:
+        """Upsert rows in batches of SAVE_BATCH_SIZE; returns the RETURNING values and inserted/updated/skipped counts.
+
+        query must contain a single VALUES %s, and its DO UPDATE should only fire when content_hash changed.
+        """
+        cursor = self.conn.cursor()
+        # xmax is 0 only on freshly inserted tuples; rows the WHERE skipped return nothing
+        query = f"{query} RETURNING (xmax = 0)" + (f", {returning}" if returning else "")
+        res = execute_values(cursor, query, rows, page_size=SAVE_BATCH_SIZE, fetch=True)
+        cursor.close()
+        inserted = sum(1 for row in res if row[0])
+        counts = {"inserted": inserted, "updated": len(res) - inserted, "skipped": len(rows) - len(res)}
+        return [row[1] for row in res] if returning else [], counts
+
+    def shard_filter(self, column: str) -> tuple[str, tuple]:
+        """SQL condition (prefixed with AND) and params selecting this shard's cities; empty when not sharded"""
+        if self.shard is None:
+            return "", ()
+        index, count = self.shard
+        # Masking the sign bit keeps the hash non-negative without abs() overflowing on INT_MIN
+        return f"AND (hashtext({column}) & 2147483647) %% %s = %s", (count, index)
+
+    def advance_watermark(self, high_water_mark: int):
+        """Shards only report their high water mark; the coordinator moves the watermark once every shard has saved.
+
+        Runs restricted to one ingestion batch never move it: an older batch whose job failed would fall
+        behind the lookback window and no incremental run would fetch it again.
+        """
+        self.high_water_mark = max(self.high_water_mark or high_water_mark, high_water_mark)
+        if self.shard is None and self.ingestion_timestamp is None:
+            self.set_watermark(high_water_mark)
+
+    def get_watermark(self) -> int | None:
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT high_water_mark FROM processor_watermarks WHERE processor = %s;", (self.watermark_key,))
+        row = cursor.fetchone()
+        cursor.close()
+        return row[0] if row else None
+
+    def fetch_since(self) -> int:
+        """Lower bound on ingestion_timestamp for an incremental fetch"""
+        watermark = self.get_watermark()
+        return 0 if watermark is None else watermark - WATERMARK_LOOKBACK_MS
+
+    def notify(self, channel: str, payload: dict):
+        """NOTIFY inside the caller's transaction; delivered to listeners only once it commits"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT pg_notify(%s, %s);", (channel, json.dumps(payload)))
+        cursor.close()
+
+    def set_watermark(self, high_water_mark: int):
+        """Advance the watermark inside the caller's transaction; it never moves backwards"""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            INSERT INTO processor_watermarks (processor, high_water_mark)
+            VALUES (%s, %s)
+            ON CONFLICT (processor) DO UPDATE
+            SET high_water_mark = GREATEST(processor_watermarks.high_water_mark, EXCLUDED.high_water_mark),
+                updated_at = NOW();
+        """, (self.watermark_key, high_water_mark))
+        cursor.close()
     
+    @abstractmethod
+    def fetch_query(self, ascending: bool = False) -> tuple[str, tuple]:
+        pass
+
     @abstractmethod
     def fetch_data(self) -> None:
         pass
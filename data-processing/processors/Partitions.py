@@ -0,0 +1,29 @@
+import os
+from time import time
+import psycopg2
+
+# Months of partitions kept ready past the current one, so inserts never hit a missing range
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "2"))
+MONTH_MS = 31 * 24 * 3600 * 1000
+
+# Range-partitioned by month on ingestion_timestamp, see migrations/010_partition_processed_tables.sql
+PARTITIONED_TABLES = [
+    "processed_weather_ingestion_data",
+    "processed_air_quality_ingestion_data",
+    "combined_processed_ingestion_data",
+    "combined_features",
+]
+# Partitioned the same way by the ingestion service; archived together with the tables derived from them
+RAW_TABLES = ["weather_ingestion_data", "air_quality_ingestion_data"]
+
+def ensure_partitions(conn: psycopg2.extensions.connection, tables: list[str] = PARTITIONED_TABLES, from_ms: int | None = None, to_ms: int | None = None) -> int:
+    """Create any missing monthly partitions between from_ms and to_ms (default: now through PARTITION_MONTHS_AHEAD); returns how many were created"""
+    from_ms = from_ms if from_ms is not None else int(time() * 1000)
+    to_ms = to_ms if to_ms is not None else from_ms + PARTITION_MONTHS_AHEAD * MONTH_MS
+    created = 0
+    cursor = conn.cursor()
+    for table in tables:
+        cursor.execute("SELECT ensure_monthly_partitions(%s, %s, %s);", (table, from_ms, to_ms))
+        created += cursor.fetchone()[0]
+    cursor.close()
+    return created
@@ -0,0 +1,74 @@
+import json
+import logging
+import os
+import select
+import threading
+from typing import Callable
+import psycopg2
+from psycopg2 import sql
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for shutdown while no notification arrives
+LISTEN_POLL_INTERVAL = float(os.getenv("LISTEN_POLL_INTERVAL", "5"))
+# Seconds to wait before reconnecting after the listening connection is lost
+LISTEN_RECONNECT_DELAY = float(os.getenv("LISTEN_RECONNECT_DELAY", "5"))
+
+class PipelineListener:
+    """LISTENs on a dedicated connection and hands each notification's JSON payload to its channel's handler"""
+    handlers: dict[str, Callable[[dict], None]]
+
+    def __init__(self, handlers: dict[str, Callable[[dict], None]], on_connect: Callable[[], None] | None = None, dsn: str | None = None):
+        self.handlers = handlers
+        # Notifications sent while nobody listens are lost; on_connect lets the caller catch up after (re)connecting
+        self.on_connect = on_connect
+        self.dsn = dsn or os.getenv("DATABASE_URL")
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._listen, name="pipeline-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=LISTEN_POLL_INTERVAL + 1)
+            self._thread = None
+
+    def _listen(self):
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                # Not from the pool: LISTEN ties the session to this thread for as long as it runs
+                conn = psycopg2.connect(self.dsn)
+                conn.autocommit = True
+                cursor = conn.cursor()
+                for channel in self.handlers:
+                    cursor.execute(sql.SQL("LISTEN {};").format(sql.Identifier(channel)))
+                cursor.close()
+                logger.info(f"[Listener]: Listening on {', '.join(self.handlers)}")
+                if self.on_connect:
+                    self.on_connect()
+
+                while not self._stopping.is_set():
+                    if select.select([conn], [], [], LISTEN_POLL_INTERVAL) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self._dispatch(notify.channel, notify.payload)
+            except Exception as err:
+                logger.error(f"[Listener]: Connection lost, reconnecting in {LISTEN_RECONNECT_DELAY}s: {err}")
+                self._stopping.wait(LISTEN_RECONNECT_DELAY)
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+
+    def _dispatch(self, channel: str, payload: str):
+        try:
+            self.handlers[channel](json.loads(payload) if payload else {})
+        except Exception as err:
+            logger.error(f"[Listener]: Handler for {channel} failed on {payload!r}: {err}")
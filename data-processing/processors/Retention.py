@@ -0,0 +1,117 @@
+import datetime
+import json
+import logging
+import os
+import re
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from .ConnectionPool import ConnectionPool, get_pool
+from .Partitions import PARTITIONED_TABLES, RAW_TABLES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Whole months kept attached before the current one; older partitions are archived and detached
+RETENTION_MONTHS = int(os.getenv("RETENTION_MONTHS", "6"))
+# Archived partitions land in <dir>/<table>/<partition>.parquet, which retraining can read back as a directory
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "data/archive")
+# Drop detached partitions once archived instead of leaving them as standalone tables
+RETENTION_DROP_DETACHED = os.getenv("RETENTION_DROP_DETACHED", "false").lower() == "true"
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", "50000"))
+
+PARTITION_SUFFIX = re.compile(r"_p(\d{4})_(\d{2})$")
+
+def retention_cutoff(months: int = RETENTION_MONTHS, today: datetime.date | None = None) -> tuple[int, int]:
+    """(year, month) of the oldest month kept; partitions before it are archived"""
+    today = today or datetime.datetime.now(tz=datetime.UTC).date()
+    index = today.year * 12 + today.month - 1 - months
+    return index // 12, index % 12 + 1
+
+def expired_partitions(conn, table: str, cutoff: tuple[int, int]) -> list[str]:
+    """Partitions of table named _pYYYY_MM for a month before cutoff, oldest first"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+        ORDER BY c.relname;
+    """, (table,))
+    names = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+
+    expired = []
+    for name in names:
+        match = PARTITION_SUFFIX.search(name)
+        if match and (int(match.group(1)), int(match.group(2))) < cutoff:
+            expired.append(name)
+    return expired
+
+def to_parquet_value(value):
+    # jsonb comes back as dicts and uuid columns as UUID objects, neither of which Arrow stores
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+def export_partition(conn, partition: str, path: str, chunk_size: int = ARCHIVE_CHUNK_SIZE) -> int:
+    """Stream one partition into a Parquet file, one row group per chunk; returns the rows written"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    partial = f"{path}.partial"
+    cursor = conn.cursor(name=f"archive_{partition}")
+    cursor.itersize = chunk_size
+    cursor.execute(f'SELECT * FROM "{partition}" ORDER BY ingestion_timestamp;')
+
+    writer = None
+    rows_written = 0
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            columns = [column.name for column in cursor.description]
+            df = pd.DataFrame.from_records([[to_parquet_value(v) for v in row] for row in rows], columns=columns)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(partial, table.schema)
+            else:
+                # A column that is all NULL in one chunk comes through as the null type
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+            rows_written += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+        cursor.close()
+        conn.rollback()
+
+    if writer is not None:
+        # Only a complete file ever appears under the final name
+        os.replace(partial, path)
+    return rows_written
+
+def archive_partitions(pool: ConnectionPool | None = None, months: int = RETENTION_MONTHS, drop: bool = RETENTION_DROP_DETACHED, archive_dir: str = RETENTION_ARCHIVE_DIR) -> dict:
+    """Export every partition older than the retention window to Parquet, then detach it (and drop it if asked)"""
+    pool = pool or get_pool()
+    cutoff = retention_cutoff(months)
+    archived = {}
+    with pool.connection() as conn:
+        expired = {table: expired_partitions(conn, table, cutoff) for table in PARTITIONED_TABLES + RAW_TABLES}
+
+    for table, partitions in expired.items():
+        for partition in partitions:
+            path = os.path.join(archive_dir, table, f"{partition}.parquet")
+            # One transaction per partition, so a failure leaves the rest of the run's work in place
+            with pool.connection() as conn:
+                rows = export_partition(conn, partition, path)
+                cursor = conn.cursor()
+                cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{partition}";')
+                if drop:
+                    cursor.execute(f'DROP TABLE "{partition}";')
+                cursor.close()
+            archived[partition] = {"table": table, "rows": rows, "path": path if rows else None, "dropped": drop}
+            logger.info(f"[Retention]: Archived {rows} rows of {partition} and detached it")
+
+    return {"cutoff": "%04d-%02d" % cutoff, "archived": archived}
@@ -0,0 +1,66 @@
+import os
+from contextlib import nullcontext
+from .WeatherDataProcessor import WeatherDataProcessor
+from .AirQualityProcessor import AirQualityDataProcessor
+from .CombinedDataProcessor import CombinedDataProcessor
+from .DataProcessor import sum_counts
+from .JobQueue import JobContext
+from .TaskExecutor import get_executor
+
+# Module-level entry points so they can be pickled into worker processes
+
+# Default number of city shards per processing run; 1 keeps everything in one process
+PROCESSING_SHARDS = int(os.getenv("PROCESSING_SHARDS", "1"))
+
+PROCESSORS = {
+    "weather": WeatherDataProcessor,
+    "aq": AirQualityDataProcessor,
+    "combined": CombinedDataProcessor,
+}
+
+def run_processor(name: str, chunk_size: int | None = None, return_rows: bool = True, job: JobContext | None = None, **options):
+    """Run one processor end to end and return its result; stage timings go to job when given"""
+    with PROCESSORS[name](**options) as processor:
+        processor.run(return_rows=return_rows, chunk_size=chunk_size, stage=job.stage if job else None)
+    return processor.result
+
+def run_shard(name: str, shard: tuple[int, int], chunk_size: int | None = None, return_rows: bool = True, **options) -> tuple:
+    """One shard of a partitioned run; returns its result and the newest ingestion_timestamp it saved"""
+    with PROCESSORS[name](shard=shard, **options) as processor:
+        processor.run(return_rows=return_rows, chunk_size=chunk_size)
+    return processor.result, processor.high_water_mark
+
+def run_partitioned(name: str, shards: int = PROCESSING_SHARDS, chunk_size: int | None = None, return_rows: bool = True, job: JobContext | None = None, **options):
+    """Split the run by hash of city_name across the process pool; every shard fetches, processes and saves on its own"""
+    if shards <= 1:
+        return run_processor(name, chunk_size=chunk_size, return_rows=return_rows, job=job, **options)
+
+    with job.stage("shards") if job else nullcontext():
+        futures = [
+            get_executor().submit_to_process(run_shard, name, (index, shards), chunk_size, return_rows, **options)
+            for index in range(shards)
+        ]
+        # Raises on the first failed shard, before the watermark moves past rows another shard did not save
+        outcomes = [future.result() for future in futures]
+
+    with job.stage("merge") if job else nullcontext():
+        marks = [mark for _, mark in outcomes if mark is not None]
+        with PROCESSORS[name](**options) as processor:
+            if processor.watermark_key and marks and processor.ingestion_timestamp is None:
+                processor.set_watermark(max(marks))
+                processor.conn.commit()
+
+    results = [result for result, _ in outcomes]
+    if return_rows:
+        return [row for result in results if isinstance(result, list) for row in result]
+    return {"saved": 0, **sum_counts([result for result in results if isinstance(result, dict)]), "shards": shards}
+
+def refresh_combined_view(job: JobContext | None = None):
+    with CombinedDataProcessor() as processor:
+        with job.stage("refresh") if job else nullcontext():
+            processor.refresh_view()
+    return processor.result
+
+def export_features(path: str) -> str:
+    with CombinedDataProcessor() as processor:
+        return processor.export_parquet(path)
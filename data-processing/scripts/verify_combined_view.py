@@ -0,0 +1,55 @@
+# verify_combined_view.py - check combined_features_view against the pandas path
+#
+# Run from data-processing/:
+#   DATABASE_URL=postgresql://... python -m scripts.verify_combined_view
+#
+# Refreshes the view, runs CombinedDataProcessor.process_data() on the same rows and
+# compares every derived feature. Exits with status 1 on any mismatch.
+import sys
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from processors.CombinedDataProcessor import CombinedDataProcessor
+
+load_dotenv()
+
+KEYS = ["weather_ingestion_uuid", "aq_ingestion_uuid"]
+DERIVED = [
+    "pollution_weather_index", "temp_pollution_ratio", "wind_pollution_clearance",
+    "environmental_stress", "month", "day", "year",
+]
+
+def main() -> int:
+    with CombinedDataProcessor(feature_storage="json") as processor:
+        processor.refresh_view()
+
+        cursor = processor.conn.cursor()
+        cursor.execute(f"SELECT {', '.join(KEYS + DERIVED)} FROM combined_features_view;")
+        view_df = pd.DataFrame.from_records(cursor.fetchall(), columns=KEYS + DERIVED)
+        cursor.close()
+
+        processor.fetch_data()
+        if len(processor.unprocessed_data) == 0:
+            print("No combined rows to compare")
+            return 0
+        pandas_df = processor.process_data().processed_data[KEYS + DERIVED]
+
+    merged = pandas_df.merge(view_df, on=KEYS, how="outer", suffixes=("_pandas", "_view"), indicator=True)
+    missing = merged[merged["_merge"] != "both"]
+    if not missing.empty:
+        print(f"{len(missing)} rows exist on only one side")
+
+    both = merged[merged["_merge"] == "both"]
+    failed = not missing.empty
+    for column in DERIVED:
+        expected = both[f"{column}_pandas"].astype(float).to_numpy()
+        actual = both[f"{column}_view"].astype(float).to_numpy()
+        mismatches = int((~np.isclose(expected, actual, rtol=1e-9, atol=1e-12)).sum())
+        print(f"{column:<26} {'OK' if mismatches == 0 else f'{mismatches} mismatches'}")
+        failed = failed or mismatches > 0
+
+    print(f"Compared {len(both)} rows: {'FAILED' if failed else 'identical'}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+# predict_batch.py - CombinedTrainer.predict_many throughput across batch sizes, records vs columns
+#
+# Run from ml/, against the newest saved artifact or a model trained on synthetic rows:
+#   python -m benchmarks.predict_batch --batch-sizes 1 8 64 512 4096 --rows 20000
+#   python -m benchmarks.predict_batch --synthetic 20000
+#
+# Prints rows/s and µs per row for each batch size, next to one predict() call per row.
+import argparse
+from time import perf_counter
+from trainers.CombinedTrainer import CombinedTrainer
+from .predict_latency import synthetic_trainer, request_bodies
+
+def throughput(predict, batches: list) -> float:
+    """Rows per second over all batches"""
+    predict(batches[0])  # warm-up
+    rows, start = 0, perf_counter()
+    for batch in batches:
+        rows += len(predict(batch))
+    return rows / (perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch prediction throughput")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64, 512, 4096])
+    parser.add_argument("--rows", type=int, default=20_000, help="rows predicted per batch size")
+    parser.add_argument("--synthetic", type=int, metavar="ROWS", help="train on this many synthetic rows instead of loading an artifact")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        trainer = synthetic_trainer(args.synthetic)
+    else:
+        artifacts = CombinedTrainer.artifacts()
+        if not artifacts:
+            parser.error("no saved artifact found; train one first or pass --synthetic")
+        trainer = CombinedTrainer.from_artifact(artifacts[0])
+
+    bodies = request_bodies(trainer, args.rows)
+    single = throughput(lambda batch: [trainer.predict(body) for body in batch], [bodies])
+
+    print(f"{len(trainer.feature_names)} features, {args.rows:,} rows per batch size, predict() loop {single:,.0f} rows/s")
+    print(f"{'batch':>7} {'records/s':>12} {'columns/s':>12} {'µs/row':>8} {'vs loop':>8}")
+    for size in args.batch_sizes:
+        records = [bodies[i:i + size] for i in range(0, len(bodies), size)]
+        columns = [{f: [body[f] for body in batch] for f in trainer.feature_names} for batch in records]
+        per_records = throughput(trainer.predict_many, records)
+        per_columns = throughput(trainer.predict_many, columns)
+        print(f"{size:>7} {per_records:>12,.0f} {per_columns:>12,.0f} {1e6 / per_records:>8.1f} {per_records / single:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
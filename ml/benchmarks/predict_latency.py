@@ -0,0 +1,89 @@
+# predict_latency.py - single-row CombinedTrainer.predict latency, DataFrame path vs NumPy path
+#
+# Run from ml/, against the newest saved artifact or a model trained on synthetic rows:
+#   python -m benchmarks.predict_latency --requests 5000
+#   python -m benchmarks.predict_latency --synthetic 20000
+#
+# Prints p50/p99/mean latency per path and checks both return the same predictions.
+import argparse
+import warnings
+from time import perf_counter
+import numpy as np
+import pandas as pd
+from trainers.CombinedTrainer import CombinedTrainer
+
+# The legacy path hands DataFrames to an estimator fitted on arrays
+warnings.filterwarnings("ignore", message="X has feature names")
+
+NUMERIC_FEATURES = [
+    "co", "no", "o3", "aqi", "nh3", "no2", "so2", "pm10", "pm2_5",
+    "clouds", "sunrise", "sunset", "humidity", "pressure", "wind_deg",
+    "sea_level", "grnd_level", "visibility", "pollution_weather_index",
+    "wind_pollution_clearance", "wind_speed",
+]
+
+def synthetic_trainer(rows: int) -> CombinedTrainer:
+    """Train on random rows shaped like the combined features, without touching the database"""
+    rng = np.random.default_rng(42)
+    trainer = CombinedTrainer.__new__(CombinedTrainer)
+    trainer.pool = trainer.conn = None
+    trainer.vocabulary = {}
+    trainer.training_data = pd.DataFrame(rng.normal(size=(rows, len(NUMERIC_FEATURES))), columns=NUMERIC_FEATURES)
+    trainer.training_data["month"] = rng.integers(1, 13, rows)
+    trainer.training_data["day"] = rng.integers(1, 29, rows)
+    trainer.target = pd.Series(rng.normal(10, 5, rows))
+    return trainer.train()
+
+def legacy_predict(trainer: CombinedTrainer, values: dict) -> float:
+    """predict() before the NumPy path: one-row DataFrame, scaler on a slice, RandomForestRegressor.predict"""
+    X = pd.DataFrame([[values[f] for f in trainer.feature_names]], columns=trainer.feature_names)
+    if trainer.scaler and trainer.num_cols:
+        X[trainer.num_cols] = trainer.scaler.transform(X[trainer.num_cols])
+    return float(trainer.model.predict(X)[0])
+
+def request_bodies(trainer: CombinedTrainer, n: int) -> list[dict]:
+    rng = np.random.default_rng(7)
+    values = rng.normal(size=(n, len(trainer.feature_names)))
+    return [dict(zip(trainer.feature_names, row.tolist())) for row in values]
+
+def measure(predict, bodies: list[dict]) -> tuple[np.ndarray, list[float]]:
+    """Per-call seconds and predictions"""
+    predict(bodies[0])  # warm-up
+    seconds, predictions = np.empty(len(bodies)), []
+    for i, body in enumerate(bodies):
+        start = perf_counter()
+        predictions.append(predict(body))
+        seconds[i] = perf_counter() - start
+    return seconds, predictions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark single-row prediction latency")
+    parser.add_argument("--requests", type=int, default=5_000)
+    parser.add_argument("--synthetic", type=int, metavar="ROWS", help="train on this many synthetic rows instead of loading an artifact")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        trainer = synthetic_trainer(args.synthetic)
+    else:
+        artifacts = CombinedTrainer.artifacts()
+        if not artifacts:
+            parser.error("no saved artifact found; train one first or pass --synthetic")
+        trainer = CombinedTrainer.from_artifact(artifacts[0], estimator=True)
+
+    bodies = request_bodies(trainer, args.requests)
+    results = {
+        "dataframe": measure(lambda body: legacy_predict(trainer, body), bodies),
+        "numpy": measure(trainer.predict, bodies),
+    }
+
+    print(f"{len(trainer.feature_names)} features, {len(trainer.model.estimators_)} trees, {args.requests:,} requests")
+    print(f"{'path':>10} {'p50 µs':>10} {'p99 µs':>10} {'mean µs':>10}")
+    for path, (seconds, _) in results.items():
+        p50, p99 = np.percentile(seconds, [50, 99]) * 1e6
+        print(f"{path:>10} {p50:>10.1f} {p99:>10.1f} {seconds.mean() * 1e6:>10.1f}")
+
+    diff = np.abs(np.array(results["dataframe"][1]) - np.array(results["numpy"][1])).max()
+    print(f"max abs prediction difference: {diff:.3g}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# predict_load.py - throughput and tail latency of concurrent single-row predictions, with and without coalescing
+#
+# Run from ml/. In-process, against a synthetic model, both modes back to back:
+#   python -m benchmarks.predict_load --concurrency 1 16 64 --requests 5000
+#
+# Or over HTTP against a running service (start it with PREDICT_COALESCE=true and =false in turn):
+#   python -m benchmarks.predict_load --url http://localhost:8002/predict --body body.json --concurrency 64
+import argparse
+import asyncio
+import json
+from time import perf_counter
+import httpx
+import numpy as np
+from trainers.PredictionBatcher import PredictionBatcher
+from trainers.TaskExecutor import TaskExecutor
+from .predict_latency import synthetic_trainer, request_bodies
+
+async def load(call, bodies: list, concurrency: int) -> tuple[float, np.ndarray]:
+    """concurrency clients sending bodies back to back; returns (wall seconds, per-request seconds)"""
+    seconds = np.empty(len(bodies))
+    queue = iter(enumerate(bodies))
+
+    async def client():
+        for i, body in queue:
+            start = perf_counter()
+            await call(body)
+            seconds[i] = perf_counter() - start
+
+    start = perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return perf_counter() - start, seconds
+
+def report(label: str, concurrency: int, wall: float, seconds: np.ndarray, extra: str = ""):
+    p50, p99 = np.percentile(seconds, [50, 99]) * 1000
+    print(f"{label:>10} {concurrency:>6} {len(seconds) / wall:>10,.0f} {p50:>8.2f} {p99:>8.2f} {extra}")
+
+async def in_process(args):
+    trainer = synthetic_trainer(args.synthetic)
+    bodies = request_bodies(trainer, args.requests)
+    executor = TaskExecutor()
+
+    for concurrency in args.concurrency:
+        async def direct(body):
+            return await executor.run_in_thread(trainer.predict, body)
+        report("direct", concurrency, *await load(direct, bodies, concurrency))
+
+        batcher = PredictionBatcher(trainer.predict_each, args.window_ms, args.max_rows, executor)
+        wall, seconds = await load(batcher.submit, bodies, concurrency)
+        report("coalesced", concurrency, wall, seconds, f"mean batch {batcher.stats()['mean_batch']:.1f}")
+    executor.shutdown()
+
+async def over_http(args):
+    with open(args.body, "r") as f:
+        body = json.load(f)
+    bodies = [body] * args.requests
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+    async with httpx.AsyncClient(limits=limits, timeout=30) as http:
+        async def post(body):
+            res = await http.post(args.url, json=body)
+            res.raise_for_status()
+        for concurrency in args.concurrency:
+            report("http", concurrency, *await load(post, bodies, concurrency))
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test single-row predictions")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--requests", type=int, default=5_000)
+    parser.add_argument("--synthetic", type=int, default=20_000, metavar="ROWS", help="rows the in-process model is trained on")
+    parser.add_argument("--window-ms", type=float, default=2)
+    parser.add_argument("--max-rows", type=int, default=64)
+    parser.add_argument("--url", help="POST to a running service instead of predicting in-process")
+    parser.add_argument("--body", help="JSON request body for --url")
+    args = parser.parse_args()
+    if args.url and not args.body:
+        parser.error("--url needs --body")
+
+    print(f"{'mode':>10} {'conc':>6} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    asyncio.run(over_http(args) if args.url else in_process(args))
+
+if __name__ == "__main__":
+    main()
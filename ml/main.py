@@ -2,58 +2,199 @@ from fastapi import FastAPI, Request
 import glob
 from dotenv import load_dotenv
 import os
-import psycopg2
-import pandas as pd
+import numpy as np
+import pyarrow as pa
 import datetime
 import pickle
+import logging
+import threading
+import warnings
+from psycopg2.extras import execute_values
+from time import time
+
+# Seconds to startup and to the first servable model are measured from here
+STARTED_AT = time()
 from trainers.CombinedTrainer import CombinedTrainer
+from trainers.ConnectionPool import get_pool
+from trainers.TaskExecutor import get_executor
+from trainers.PipelineListener import PipelineListener
+from trainers.tasks import train_combined_model
+from trainers.PredictionBatcher import PredictionBatcher, PREDICT_COALESCE
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 PREDICTION_MODEL = "aqi_predictor_1758189715"
+# Retrain in the background when the processing service announces new combined rows
+RETRAIN_ON_NEW_DATA = os.getenv("RETRAIN_ON_NEW_DATA", "false").lower() == "true"
+# Minimum seconds between event-triggered retrains, so a burst of batches trains once
+RETRAIN_MIN_INTERVAL = float(os.getenv("RETRAIN_MIN_INTERVAL", "300"))
+# Train in the background at startup: "missing" (only without a saved artifact), "always" or "never"
+TRAIN_ON_STARTUP = os.getenv("TRAIN_ON_STARTUP", "missing")
+# Largest batch /predict/batch accepts
+PREDICT_BATCH_MAX_ROWS = int(os.getenv("PREDICT_BATCH_MAX_ROWS", "10000"))
+ARROW_STREAM_TYPE = "application/vnd.apache.arrow.stream"
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
 @app.on_event("startup")
 def run_migrations():
-    conn = psycopg2.connect(DATABASE_URL)
-    conn.autocommit = True
-    cur = conn.cursor()
-
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS migrations (
-            id SERIAL PRIMARY KEY,
-            filename TEXT UNIQUE,
-            applied_at TIMESTAMP DEFAULT NOW()
-        );
-    """)
-
-    for file in sorted(glob.glob("migrations/*.sql")):
-        cur.execute("SELECT 1 FROM migrations WHERE filename = %s", (file,))
-        if cur.fetchone():
-            continue
-        with open(file, "r") as f:
-            sql = f.read()
-            cur.execute(sql)
-        cur.execute("INSERT INTO migrations (filename) VALUES (%s)", (file,))
+    with get_pool().connection() as conn:
+        cur = conn.cursor()
+
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS migrations (
+                id SERIAL PRIMARY KEY,
+                filename TEXT UNIQUE,
+                applied_at TIMESTAMP DEFAULT NOW()
+            );
+        """)
+
+        for file in sorted(glob.glob("migrations/*.sql")):
+            cur.execute("SELECT 1 FROM migrations WHERE filename = %s", (file,))
+            if cur.fetchone():
+                continue
+            with open(file, "r") as f:
+                sql = f.read()
+                cur.execute(sql)
+            cur.execute("INSERT INTO migrations (filename) VALUES (%s)", (file,))
+
+        cur.close()
+
+    load_trainer()
+    if RETRAIN_ON_NEW_DATA:
+        listener.start()
+    startup_metrics["startup_seconds"] = round(time() - STARTED_AT, 3)
+    logger.info(f"[Startup]: Ready in {startup_metrics['startup_seconds']}s, serving {startup_metrics['artifact'] or 'no model yet'}")
+
+@app.on_event("shutdown")
+def close_pool():
+    listener.stop()
+    get_executor().shutdown()
+    get_pool().close()
+
+@app.get("/pool/stats")
+def pool_stats():
+    return get_pool().stats()
+
+# Swapped as a whole once a retrain finishes; requests in flight keep the trainer they started with
+trainer: CombinedTrainer | None = None
+startup_metrics = {"startup_seconds": None, "model_ready_seconds": None, "artifact": None}
 
-    conn.commit()
-    cur.close()
-    conn.close()
+def load_trainer():
+    """Serve the newest saved artifact straight away; training only happens in the background"""
+    for path in CombinedTrainer.artifacts():
+        try:
+            install_trainer(CombinedTrainer.from_artifact(path))
+            break
+        except Exception as err:
+            logger.warning(f"[Startup]: Skipping model artifact {path}: {err}")
+    if TRAIN_ON_STARTUP == "always" or (TRAIN_ON_STARTUP == "missing" and trainer is None):
+        start_retrain("startup")
 
-# Train a model once at startup
-trainer = CombinedTrainer().fetch_training_data().extract_features().train()
+def install_trainer(new_trainer: CombinedTrainer):
+    global trainer
+    if new_trainer.metadata is None and new_trainer.artifact_path:
+        # Freshly trained in a worker process: serve the saved artifact instead, memory-mapped like every other worker's copy
+        new_trainer = CombinedTrainer.from_artifact(new_trainer.artifact_path)
+    trainer = new_trainer
+    if startup_metrics["model_ready_seconds"] is None:
+        startup_metrics["model_ready_seconds"] = round(time() - STARTED_AT, 3)
+    startup_metrics["artifact"] = new_trainer.artifact_path
+
+@app.get("/metrics")
+def metrics():
+    return {
+        **startup_metrics,
+        "trained_at": trainer.trained_at if trainer else None,
+        "retraining": retrain_state["running"],
+        "coalescing": {
+            "enabled": PREDICT_COALESCE,
+            "predict": predict_batcher.stats(),
+            "simple_aqi": simple_aqi_batcher.stats(),
+        },
+    }
+
+@app.get("/train")
+async def train_route():
+    # Training is CPU-bound, so it runs in the process pool; predictions keep using the old model until it finishes
+    new_trainer = await get_executor().run_in_process(train_combined_model)
+    install_trainer(new_trainer)
+    return {"status": "success", "features": len(new_trainer.feature_names)}
+
+retrain_lock = threading.Lock()
+retrain_state = {"running": False, "last_started": 0.0}
+
+def start_retrain(reason: str, min_interval: float = 0) -> bool:
+    """Train and save a new model in the process pool unless one is already training; swapped in when done"""
+    with retrain_lock:
+        if retrain_state["running"] or time() - retrain_state["last_started"] < min_interval:
+            return False
+        retrain_state["running"] = True
+        retrain_state["last_started"] = time()
+    logger.info(f"[Training]: Retraining ({reason})")
+    get_executor().submit_to_process(train_combined_model).add_done_callback(swap_trainer)
+    return True
+
+def on_combined_processed(event: dict):
+    start_retrain(f"after {event.get('rows', 'new')} combined rows", RETRAIN_MIN_INTERVAL)
+
+def swap_trainer(future):
+    try:
+        install_trainer(future.result())
+    except Exception as err:
+        logger.error(f"[Training]: Background retrain failed: {err}")
+    finally:
+        with retrain_lock:
+            retrain_state["running"] = False
+
+listener = PipelineListener({"combined_processed": on_combined_processed})
 
 @app.post("/predict")
 async def predict_route(request: Request):
     body = await request.json()
+    current = trainer
+    if current is None:
+        return {"error": "No model loaded yet, training is in progress"}
     try:
-        prediction = trainer.predict(body)
+        if PREDICT_COALESCE:
+            prediction = await predict_batcher.submit(body)
+        else:
+            prediction = await get_executor().run_in_thread(current.predict, body)
         return {"prediction": prediction}
     except ValueError as e:
         return {"error": str(e)}
 
+def predict_coalesced(batch: list[dict]) -> list[float | Exception]:
+    # The trainer at flush time; a swap between submit and flush just means the newer model answers
+    return trainer.predict_each(batch)
+
+predict_batcher = PredictionBatcher(predict_coalesced)
+
+def predict_batch(current: CombinedTrainer, body: bytes | list | dict, arrow: bool) -> list[float]:
+    data = pa.ipc.open_stream(body).read_all().to_pandas() if arrow else body
+    rows = max((len(v) for v in data.values() if isinstance(v, list)), default=0) if isinstance(data, dict) else len(data)
+    if rows > PREDICT_BATCH_MAX_ROWS:
+        raise ValueError(f"Batch of {rows} rows is larger than {PREDICT_BATCH_MAX_ROWS}")
+    return current.predict_many(data)
+
+@app.post("/predict/batch")
+async def predict_batch_route(request: Request):
+    # A JSON list of records, a JSON object of equally long columns, or an Arrow IPC stream
+    current = trainer
+    if current is None:
+        return {"error": "No model loaded yet, training is in progress"}
+    arrow = request.headers.get("content-type", "").startswith(ARROW_STREAM_TYPE)
+    body = await request.body() if arrow else await request.json()
+    try:
+        predictions = await get_executor().run_in_thread(predict_batch, current, body, arrow)
+        return {"predictions": predictions, "count": len(predictions)}
+    except ValueError as e:
+        # Also covers malformed Arrow streams (pyarrow.ArrowInvalid)
+        return {"error": str(e)}
+
 @app.get("/predictions/latest")
 def latest_prediction():
     # TODO: implement fetch from DB if needed
@@ -63,48 +204,71 @@ def latest_prediction():
 with open(f'models/{PREDICTION_MODEL}.pkl', 'rb') as f:
     simple_model = pickle.load(f)
 
-@app.post("/predict/simple/aqi")
-async def simple_aqi_route(request: Request):
-    timestamp = int(datetime.datetime.now(datetime.UTC).timestamp() * 1000)
-    try:
-        data = await request.json()
-        features = ["temperature", "humidity", "pressure", "wind_speed"]
+AQI_LABELS = {1: "Good", 2: "Fair", 3: "Moderate", 4: "Poor", 5: "Very Poor"}
+SIMPLE_AQI_FEATURES = ["temperature", "humidity", "pressure", "wind_speed"]
 
-        X = pd.DataFrame([data])[features]
-        prediction = simple_model.predict(X)[0]
-        aqi = max(1, min(5, round(prediction)))
-        aqi_labels = {1: "Good", 2: "Fair", 3: "Moderate", 4: "Poor", 5: "Very Poor"}
+# The simple model may have been fitted on a DataFrame; it is fed plain arrays in the same column order
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
 
-        conn = psycopg2.connect(DATABASE_URL)
-        cur = conn.cursor()
+def predict_simple_aqi_many(requests: list[tuple[dict, int]]) -> list[dict | Exception]:
+    """(body, timestamp) requests in, one result or error per request out; one model call and one INSERT for all"""
+    rows, results = [], []
+    for data, timestamp in requests:
+        try:
+            # One row straight into an array; a DataFrame costs more than the model call itself
+            rows.append([float(data[f]) for f in SIMPLE_AQI_FEATURES])
+            results.append(None)
+        except (KeyError, TypeError, ValueError) as err:
+            results.append(ValueError(f"Invalid input, expected numbers for {SIMPLE_AQI_FEATURES}: {err!r}"))
+    if not rows:
+        return results
 
-        values = (
-            float(X.iloc[0]["temperature"]),
-            float(X.iloc[0]["humidity"]),
-            float(X.iloc[0]["pressure"]),
-            float(X.iloc[0]["wind_speed"]),
-            PREDICTION_MODEL,
-            aqi,
-            aqi_labels[aqi],
-            timestamp
-        )
+    X = np.array(rows)
+    predictions = iter(simple_model.predict(X).tolist())
+    values = []
+    for i, (_, timestamp) in enumerate(requests):
+        if results[i] is not None:
+            continue
+        aqi = max(1, min(5, round(next(predictions))))
+        values.append((*X[len(values)].tolist(), PREDICTION_MODEL, aqi, AQI_LABELS[aqi], timestamp))
+        results[i] = {"aqi": int(aqi), "aqi_label": AQI_LABELS[aqi]}
 
-        cur.execute(
+    with get_pool().connection() as conn:
+        cur = conn.cursor()
+        execute_values(
+            cur,
             """
             INSERT INTO simple_aqi_predictions 
             (temperature, humidity, pressure, wind_speed, prediction_model, predicted_aqi, predicted_aqi_label, timestamp) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            VALUES %s
             """,
             values
         )
-
-        conn.commit()
         cur.close()
-        conn.close()
+
+    return results
+
+def predict_simple_aqi(data: dict, timestamp: int) -> dict:
+    result = predict_simple_aqi_many([(data, timestamp)])[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+simple_aqi_batcher = PredictionBatcher(predict_simple_aqi_many)
+
+@app.post("/predict/simple/aqi")
+async def simple_aqi_route(request: Request):
+    timestamp = int(datetime.datetime.now(datetime.UTC).timestamp() * 1000)
+    try:
+        data = await request.json()
+        if PREDICT_COALESCE:
+            prediction = await simple_aqi_batcher.submit((data, timestamp))
+        else:
+            prediction = await get_executor().run_in_thread(predict_simple_aqi, data, timestamp)
 
         return {
             "status": "success",
-            "prediction": {"aqi": int(aqi), "aqi_label": aqi_labels[aqi]},
+            "prediction": prediction,
             "timestamp": timestamp
         }
 
@@ -0,0 +1,38 @@
+# Run from ml/: python -m unittest discover tests
+import tempfile
+import unittest
+from benchmarks.predict_latency import synthetic_trainer, request_bodies, legacy_predict
+from trainers.CombinedTrainer import CombinedTrainer
+
+class ForestInferenceTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        path = synthetic_trainer(500).save_model(cls.directory.name).artifact_path
+        # Memory-mapped forest arrays, plus the estimator they were written from
+        cls.trainer = CombinedTrainer.from_artifact(path, mmap_mode="r", estimator=True)
+        cls.bodies = request_bodies(cls.trainer, 50)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_predict_matches_the_estimator(self):
+        for body in self.bodies:
+            self.assertAlmostEqual(self.trainer.predict(body), legacy_predict(self.trainer, body), places=9)
+
+    def test_predict_many_matches_predict(self):
+        for body, prediction in zip(self.bodies, self.trainer.predict_many(self.bodies)):
+            self.assertAlmostEqual(prediction, self.trainer.predict(body), places=9)
+
+    def test_non_finite_values_are_rejected(self):
+        feature = self.trainer.feature_names[0]
+        for value in (float("nan"), float("inf"), float("-inf")):
+            body = {**self.bodies[0], feature: value}
+            with self.assertRaises(ValueError):
+                self.trainer.predict(body)
+            with self.assertRaises(ValueError):
+                self.trainer.predict_many([self.bodies[1], body])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+# Run from ml/: python -m unittest discover tests
+import asyncio
+import unittest
+from benchmarks.predict_latency import synthetic_trainer, request_bodies
+from trainers.PredictionBatcher import PredictionBatcher
+from trainers.TaskExecutor import TaskExecutor
+
+class PredictEachTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.trainer = synthetic_trainer(500)
+        cls.good = request_bodies(cls.trainer, 4)
+
+    def test_bad_bodies_fail_only_their_own_slot(self):
+        missing = dict(self.good[0])
+        missing.pop(self.trainer.feature_names[0])
+        bad = [[1, 2, 3], "not a body", None, missing, {**self.good[0], self.trainer.feature_names[1]: "x"}]
+        batch = self.good[:2] + bad + self.good[2:]
+
+        results = self.trainer.predict_each(batch)
+
+        self.assertEqual(len(results), len(batch))
+        for body, result in zip(batch, results):
+            if body in self.good:
+                self.assertAlmostEqual(result, self.trainer.predict(body))
+            else:
+                self.assertIsInstance(result, ValueError)
+
+    def test_batcher_raises_only_to_the_bad_request(self):
+        executor = TaskExecutor(threads=2)
+        batcher = PredictionBatcher(self.trainer.predict_each, window_ms=50, max_rows=64, executor=executor)
+        batch = self.good[:2] + [[1, 2, 3]] + self.good[2:]
+
+        async def submit_all():
+            return await asyncio.gather(*(batcher.submit(body) for body in batch), return_exceptions=True)
+
+        try:
+            results = asyncio.run(submit_all())
+        finally:
+            executor.shutdown()
+
+        self.assertEqual(batcher.stats()["batches"], 1)
+        self.assertIsInstance(results[2], ValueError)
+        for body, result in zip(self.good, results[:2] + results[3:]):
+            self.assertAlmostEqual(result, self.trainer.predict(body))
+
+if __name__ == "__main__":
+    unittest.main()
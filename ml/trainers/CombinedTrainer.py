@@ -1,31 +1,145 @@
 from .Trainer import Trainer
+from .ConnectionPool import ConnectionPool
+import glob
+import io
 import json
+import os
+import re
+import shutil
+import joblib
+import numpy as np
 import pandas as pd
 import datetime
-import pickle
+import sklearn
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import StandardScaler
 
 MODEL_NAME = "advanced_model_"
+# Where save_model() writes artifacts and the service looks for the newest one at startup
+MODEL_DIR = os.getenv("MODEL_DIR", "./models")
+# Artifacts are <MODEL_DIR>/<MODEL_NAME><trained_at>/ holding estimator.joblib, metadata.json and
+# forest/<array>.npy, the node arrays predictions are served from
+ARTIFACT_VERSION = 2
+ARTIFACT_PATTERN = re.compile(rf"{MODEL_NAME}(\d+)$")
+FOREST_ARRAYS = ["feature", "threshold", "left", "right", "value", "roots"]
+# np.load mmap_mode for the forest arrays, so workers share them through the page cache; empty loads into memory
+MODEL_MMAP_MODE = os.getenv("MODEL_MMAP_MODE", "r") or None
+# How many artifacts save_model() keeps in MODEL_DIR, newest first; 0 keeps all of them
+MODEL_KEEP_ARTIFACTS = int(os.getenv("MODEL_KEEP_ARTIFACTS", "5"))
+
+# "json" (combined_processed_ingestion_data), "columnar" (combined_features), a .parquet path or a
+# directory of them, e.g. data/archive/combined_features written by the processing retention job
+TRAINING_SOURCE = os.getenv("TRAINING_SOURCE", "json")
+
+# Columns of combined_features that are not model features
+KEY_COLUMNS = ["weather_ingestion_uuid", "aq_ingestion_uuid", "ingestion_timestamp", "content_hash"]
+
+def build_forest(model: RandomForestRegressor) -> dict[str, np.ndarray]:
+    """Every tree's nodes concatenated into flat arrays, roots holding where each tree starts.
+
+    Leaves point at themselves on both sides, so walking a row just stops moving once it reaches one.
+    """
+    arrays = {name: [] for name in FOREST_ARRAYS}
+    offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        nodes = np.arange(tree.node_count) + offset
+        leaf = tree.children_left == -1
+        arrays["feature"].append(np.where(leaf, 0, tree.feature))
+        arrays["threshold"].append(tree.threshold)
+        arrays["left"].append(np.where(leaf, nodes, tree.children_left + offset))
+        arrays["right"].append(np.where(leaf, nodes, tree.children_right + offset))
+        arrays["value"].append(tree.value[:, 0, 0])
+        arrays["roots"].append([offset])
+        offset += tree.node_count
+    dtypes = {"feature": np.int32, "threshold": np.float64, "value": np.float64}
+    return {name: np.concatenate(parts).astype(dtypes.get(name, np.int64)) for name, parts in arrays.items()}
 
 class CombinedTrainer(Trainer):
     data: pd.DataFrame | None
 
-    def __init__(self, model_uri: str | None = None):
+    def __init__(self, model_uri: str | None = None, pool: ConnectionPool | None = None):
         self.model = None
         self.scaler = None
         self.feature_names = None
+        self.num_cols = None
+        self.trained_at = None
+        self.training_rows = None
+        self.vocabulary = {}
+        self.metadata = None
+        self.artifact_path = None
+        self.feature_index = None
+        self.forest = None
 
         if model_uri:
             try:
-                with open(model_uri, "rb") as f:
-                    self.model = pickle.load(f)
+                self.__dict__.update(self.read_artifact(model_uri))
+                self.artifact_path = model_uri
+                self.compile_inference()
             except Exception:
                 print("⚠️ Could not load model from", model_uri)
 
-        super().__init__()
+        super().__init__(pool)
+
+    @classmethod
+    def from_artifact(cls, path: str, mmap_mode: str | None = MODEL_MMAP_MODE, estimator: bool = False) -> "CombinedTrainer":
+        """A trainer restored from save_model() that can predict straight away; it holds no database connection.
+
+        Predictions only need the forest arrays, so the scikit-learn estimator is loaded only when asked for.
+        """
+        trainer = cls.__new__(cls)
+        trainer.pool = trainer.conn = None
+        trainer.data = trainer.training_data = trainer.target = None
+        trainer.__dict__.update(cls.read_artifact(path, mmap_mode, estimator))
+        trainer.artifact_path = path
+        return trainer.compile_inference()
+
+    @staticmethod
+    def read_artifact(path: str, mmap_mode: str | None = MODEL_MMAP_MODE, estimator: bool = True) -> dict:
+        with open(os.path.join(path, "metadata.json"), "r") as f:
+            metadata = json.load(f)
+        if metadata.get("format_version") != ARTIFACT_VERSION:
+            raise ValueError(f"{path} has artifact format {metadata.get('format_version')}, expected {ARTIFACT_VERSION}")
+
+        scaler = None
+        if metadata["scaler"] is not None:
+            # Rebuilt from its parameters, so the artifact never depends on pickled scikit-learn internals
+            scaler = StandardScaler()
+            scaler.mean_ = np.asarray(metadata["scaler"]["mean"])
+            scaler.scale_ = np.asarray(metadata["scaler"]["scale"])
+            scaler.var_ = scaler.scale_ ** 2
+            scaler.n_samples_seen_ = metadata["scaler"]["n_samples_seen"]
+            scaler.n_features_in_ = len(metadata["num_cols"])
+            scaler.feature_names_in_ = np.asarray(metadata["num_cols"], dtype=object)
+
+        # scikit-learn copies a tree's arrays into its own buffers on unpickling, so only these stay mapped
+        forest = {name: np.load(os.path.join(path, "forest", f"{name}.npy"), mmap_mode=mmap_mode) for name in FOREST_ARRAYS}
+
+        return {
+            "model": joblib.load(os.path.join(path, "estimator.joblib")) if estimator else None,
+            "forest": forest,
+            "scaler": scaler,
+            "feature_names": metadata["feature_names"],
+            "num_cols": metadata["num_cols"],
+            "vocabulary": metadata["vocabulary"],
+            "trained_at": metadata["trained_at"],
+            "training_rows": metadata["training_rows"],
+            "metadata": metadata,
+        }
+
+    @staticmethod
+    def artifacts(directory: str = MODEL_DIR) -> list[str]:
+        """Saved artifact directories, newest first"""
+        stamped = [(int(m.group(1)), p) for p in glob.glob(os.path.join(directory, f"{MODEL_NAME}*")) if (m := ARTIFACT_PATTERN.search(p))]
+        return [p for _, p in sorted(stamped, reverse=True)]
+
+    def fetch_training_data(self, source: str = TRAINING_SOURCE):
+        if source == "columnar":
+            return self.fetch_columnar_training_data()
+        if source.endswith(".parquet") or os.path.isdir(source):
+            self.data = self.expand_category_codes(pd.read_parquet(path=source).drop(columns=KEY_COLUMNS, errors="ignore"))
+            return self
 
-    def fetch_training_data(self):
         cursor = self.conn.cursor()
         cursor.execute("""
             SELECT json_data FROM combined_processed_ingestion_data 
@@ -35,8 +149,48 @@ class CombinedTrainer(Trainer):
         json_strings = [r[0] for r in res]
         records = [json.loads(js) if isinstance(js, str) else js for js in json_strings]
         self.data = pd.DataFrame(records)
+        # The JSON rows carry one-hot columns already; the vocabulary is only recorded
+        self.fetch_vocabulary()
         return self
 
+    def fetch_columnar_training_data(self):
+        """Load combined_features with a single COPY and parse it column-wise"""
+        cursor = self.conn.cursor()
+        buf = io.StringIO()
+        cursor.copy_expert("""
+            COPY (SELECT * FROM combined_features ORDER BY ingestion_timestamp DESC)
+            TO STDOUT WITH (FORMAT csv, HEADER)
+        """, buf)
+        cursor.close()
+        buf.seek(0)
+        self.data = self.expand_category_codes(pd.read_csv(buf).drop(columns=KEY_COLUMNS, errors="ignore"))
+        return self
+
+    def expand_category_codes(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Turn <column>_code columns back into the same one-hot columns the JSON rows carry"""
+        code_columns = [c for c in df.columns if c.endswith("_code")]
+        if not code_columns:
+            return df
+
+        vocabulary = self.fetch_vocabulary()
+        for code_column in code_columns:
+            column = code_column[: -len("_code")]
+            df[column] = pd.Categorical.from_codes(df.pop(code_column), categories=vocabulary.get(column, []))
+        df = pd.get_dummies(data=df, columns=[c[: -len("_code")] for c in code_columns], drop_first=True, dtype=int)
+        df.columns = df.columns.str.replace(" ", "_")
+        return df
+
+    def fetch_vocabulary(self) -> dict[str, list[str]]:
+        """Category lists by column, in code order; kept for the artifact's metadata"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT column_name, category FROM category_vocabulary ORDER BY column_name, idx;")
+        vocabulary: dict[str, list[str]] = {}
+        for column, category in cursor.fetchall():
+            vocabulary.setdefault(column, []).append(category)
+        cursor.close()
+        self.vocabulary = vocabulary
+        return vocabulary
+
     def extract_features(self):
         if self.data is None:
             raise ValueError("Training data has not been fetched yet. Please fetch and try again.")
@@ -73,47 +227,180 @@ class CombinedTrainer(Trainer):
 
         # Train model
         model = RandomForestRegressor(n_estimators=55, random_state=42)
-        model.fit(final_df, self.target)
+        # Fitted on a plain array, so predicting from arrays never trips scikit-learn's feature-name checks
+        model.fit(final_df.to_numpy(dtype=np.float32), self.target)
 
         # Save artifacts
         self.model = model
         self.feature_names = final_df.columns.tolist()
         self.num_cols = num_existing
+        self.trained_at = int(datetime.datetime.now(tz=datetime.UTC).timestamp() * 1000)
+        self.training_rows = len(final_df)
+        # Rebuilt from the new estimator rather than kept from an artifact this trainer was loaded from
+        self.forest = None
+        return self.compile_inference()
+
+    def compile_inference(self):
+        """Precompute what predictions need: each feature's position, and per-position offset and divisor
+        so that scaling is one (x - offset) / divisor over the whole row (0 and 1 for unscaled features)"""
+        self.feature_index = {f: i for i, f in enumerate(self.feature_names)}
+        self.offset = np.zeros(len(self.feature_names))
+        self.divisor = np.ones(len(self.feature_names))
+        if self.scaler is not None and self.num_cols:
+            positions = [self.feature_index[c] for c in self.num_cols]
+            self.offset[positions] = self.scaler.mean_
+            self.divisor[positions] = self.scaler.scale_
+        # A forest's prediction is the mean of its trees'; walking the node arrays directly skips per-call
+        # input validation and the thread pool RandomForestRegressor.predict starts for every call
+        if self.forest is None and isinstance(self.model, RandomForestRegressor):
+            self.forest = build_forest(self.model)
         return self
 
+    def predict_rows(self, X: np.ndarray) -> np.ndarray:
+        """Scale and predict a (rows, features) float64 array in feature_names order"""
+        # Scaled in float64 like StandardScaler, then cast once to the float32 the trees compare against
+        X = ((X - self.offset) / self.divisor).astype(np.float32)
+        if self.forest is None:
+            return self.model.predict(X)
+        forest = self.forest
+        # One node per (tree, row), every tree stepped down one level at a time
+        nodes = np.repeat(forest["roots"][:, None], len(X), axis=1)
+        rows = np.arange(len(X))
+        while True:
+            left = X[rows, forest["feature"][nodes]] <= forest["threshold"][nodes]
+            step = np.where(left, forest["left"][nodes], forest["right"][nodes])
+            if np.array_equal(step, nodes):
+                break
+            nodes = step
+        return forest["value"][nodes].mean(axis=0)
+
     def predict(self, values: dict) -> float:
-        if not self.model:
+        return float(self.predict_rows(self.vectorize(values)[None, :])[0])
+
+    def predict_each(self, batch: list[dict]) -> list[float | Exception]:
+        """Predict independent requests with one model call; a request that cannot be vectorized gets its
+        exception back in its slot instead of failing the others"""
+        rows, results = [], []
+        for values in batch:
+            try:
+                rows.append(self.vectorize(values))
+                results.append(None)
+            except Exception as err:
+                results.append(err)
+        predictions = iter(self.predict_rows(np.vstack(rows)).tolist() if rows else [])
+        return [next(predictions) if result is None else result for result in results]
+
+    def vectorize(self, values: dict) -> np.ndarray:
+        """One request as a float64 row in feature_names order"""
+        if self.model is None and self.forest is None:
             raise ValueError("Model not found. Train or load a model first.")
         if not self.feature_names:
             raise ValueError("Feature names are missing. Train the model first.")
+        if self.feature_index is None:
+            self.compile_inference()
+        if not isinstance(values, dict):
+            raise ValueError(f"Expected an object of feature values, got {type(values).__name__}")
 
-        # Validate features
-        missing = [f for f in self.feature_names if f not in values]
-        extra = [f for f in values if f not in self.feature_names]
-
-        if missing:
-            raise ValueError(
-                f"Missing features: {missing}. "
-                f"You must include ALL of: {self.feature_names}"
-            )
-        if extra:
+        # Same size and every key known means every feature is present; only failures pay for the diff
+        if len(values) != len(self.feature_index) or any(f not in self.feature_index for f in values):
+            missing = [f for f in self.feature_names if f not in values]
+            extra = [f for f in values if f not in self.feature_index]
+            if missing:
+                raise ValueError(
+                    f"Missing features: {missing}. "
+                    f"You must include ALL of: {self.feature_names}"
+                )
             raise ValueError(
                 f"Unexpected features: {extra}. "
                 f"Expected only: {self.feature_names}"
             )
 
-        # Build DataFrame in correct order
-        X = pd.DataFrame([[values[f] for f in self.feature_names]], columns=self.feature_names)
+        x = np.empty(len(self.feature_index))
+        try:
+            for feature, value in values.items():
+                x[self.feature_index[feature]] = value
+        except TypeError:
+            raise ValueError(f"Feature {feature} must be a number, got {value!r}")
+        # The forest walk has no missing-value routing, and predict_many rejects these too
+        if not np.isfinite(x).all():
+            raise ValueError(f"Features must be finite numbers: {[f for f in self.feature_names if not np.isfinite(x[self.feature_index[f]])]}")
+        return x
 
-        # Apply scaling
-        if self.scaler and self.num_cols:
-            X[self.num_cols] = self.scaler.transform(X[self.num_cols])
+    def predict_many(self, data: list[dict] | dict[str, list] | pd.DataFrame) -> list[float]:
+        """Predict a batch of records, columns ({feature: [values]}) or a DataFrame with one vectorized call"""
+        if self.model is None and self.forest is None:
+            raise ValueError("Model not found. Train or load a model first.")
+        if not self.feature_names:
+            raise ValueError("Feature names are missing. Train the model first.")
+
+        X = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+        if X.empty:
+            return []
+
+        # Whole-batch validation: set differences on the columns, then one null scan for rows lacking a feature
+        columns = set(X.columns)
+        missing = [f for f in self.feature_names if f not in columns]
+        extra = list(columns - set(self.feature_names))
+        if missing:
+            raise ValueError(f"Missing features: {missing}. You must include ALL of: {self.feature_names}")
+        if extra:
+            raise ValueError(f"Unexpected features: {extra}. Expected only: {self.feature_names}")
+        X = X[self.feature_names].to_numpy(dtype=np.float64)
+        incomplete = np.isnan(X).any(axis=1)
+        if incomplete.any():
+            raise ValueError(f"Rows missing features: {np.flatnonzero(incomplete)[:10].tolist()}")
+        infinite = np.isinf(X).any(axis=1)
+        if infinite.any():
+            raise ValueError(f"Rows with non-finite features: {np.flatnonzero(infinite)[:10].tolist()}")
 
-        pred = self.model.predict(X)
-        return float(pred[0])
+        if self.feature_index is None:
+            self.compile_inference()
+        return self.predict_rows(X).tolist()
+
+    def save_model(self, directory: str = MODEL_DIR, keep: int = MODEL_KEEP_ARTIFACTS):
+        """Write the artifact directory. It is assembled under a temporary name and renamed, so a service
+        starting up never loads half an artifact; once it is in place all but the newest keep are deleted"""
+        if not self.model:
+            raise ValueError("Model not found. Train a model first.")
+        trained_at = self.trained_at or int(datetime.datetime.now(tz=datetime.UTC).timestamp() * 1000)
+        path = os.path.join(directory, f"{MODEL_NAME}{trained_at}")
+        staging = f"{path}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        # The estimator is kept for inspection and retraining; serving reads the forest arrays
+        joblib.dump(self.model, os.path.join(staging, "estimator.joblib"))
+        if self.forest is None:
+            self.compile_inference()
+        os.makedirs(os.path.join(staging, "forest"))
+        for name in FOREST_ARRAYS:
+            np.save(os.path.join(staging, "forest", f"{name}.npy"), self.forest[name])
+        with open(os.path.join(staging, "metadata.json"), "w") as f:
+            json.dump(self.artifact_metadata(trained_at), f, indent=2, default=str)
+        os.replace(staging, path)
+        self.artifact_path = path
+
+        if keep > 0:
+            # A service still serving an older artifact keeps its open files until it reloads
+            for old in self.artifacts(directory)[keep:]:
+                if old != path:
+                    shutil.rmtree(old, ignore_errors=True)
+        return self
 
-    def save_model(self):
-        path = f"./models/{MODEL_NAME}{int(datetime.datetime.now().timestamp()*1000)}.pkl"
-        with open(path, "wb") as f:
-            pickle.dump(self.model, f)
-        return self
\ No newline at end of file
+    def artifact_metadata(self, trained_at: int) -> dict:
+        return {
+            "format_version": ARTIFACT_VERSION,
+            "trained_at": trained_at,
+            "training_rows": self.training_rows,
+            "estimator": type(self.model).__name__,
+            "estimator_params": self.model.get_params(),
+            "sklearn_version": sklearn.__version__,
+            "feature_names": self.feature_names,
+            "num_cols": self.num_cols,
+            "scaler": {
+                "mean": self.scaler.mean_.tolist(),
+                "scale": self.scaler.scale_.tolist(),
+                "n_samples_seen": int(self.scaler.n_samples_seen_),
+            } if self.scaler is not None else None,
+            "vocabulary": self.vocabulary,
+        }
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import threading
+from typing import Callable
+from .TaskExecutor import TaskExecutor, get_executor
+
+# Coalesce concurrent single-row predictions into one model call
+PREDICT_COALESCE = os.getenv("PREDICT_COALESCE", "false").lower() == "true"
+# How long the first request of a batch waits for company, and the batch size that flushes right away
+PREDICT_COALESCE_WINDOW_MS = float(os.getenv("PREDICT_COALESCE_WINDOW_MS", "2"))
+PREDICT_COALESCE_MAX_ROWS = int(os.getenv("PREDICT_COALESCE_MAX_ROWS", "64"))
+
+class PredictionBatcher:
+    """Collects requests arriving within a short window on the event loop and runs them as one batch.
+
+    predict_batch takes the list of requests and returns one result per request, in order; a result that
+    is an exception is raised to that request only. It runs on the thread pool, so the loop keeps collecting
+    the next batch meanwhile.
+    """
+    window_ms: float
+    max_rows: int
+
+    def __init__(self, predict_batch: Callable[[list], list], window_ms: float = PREDICT_COALESCE_WINDOW_MS,
+                 max_rows: int = PREDICT_COALESCE_MAX_ROWS, executor: TaskExecutor | None = None):
+        self.predict_batch = predict_batch
+        self.window_ms = window_ms
+        self.max_rows = max(max_rows, 1)
+        self.executor = executor or get_executor()
+        self._pending: list[tuple[object, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        # The loop only keeps weak references to tasks
+        self._running: set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        self._stats = {"batches": 0, "rows": 0, "max_batch": 0}
+
+    async def submit(self, request):
+        """Queue one request and wait for its own result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((request, future))
+        if len(self._pending) >= self.max_rows:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_ms / 1000, self._flush)
+        return await future
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["mean_batch"] = stats["rows"] / stats["batches"] if stats["batches"] else 0.0
+        stats["window_ms"] = self.window_ms
+        stats["max_rows"] = self.max_rows
+        return stats
+
+    def _flush(self):
+        # Only ever called on the event loop, so _pending needs no lock
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: list[tuple[object, asyncio.Future]]):
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["rows"] += len(batch)
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+        try:
+            results = await self.executor.run_in_thread(self.predict_batch, [request for request, _ in batch])
+        except Exception as err:
+            results = [err] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            # The caller may have gone away, e.g. a cancelled request
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -1,12 +1,33 @@
 from abc import ABC, abstractmethod
 import psycopg2 
 import os
+from .ConnectionPool import ConnectionPool, get_pool
 
 class Trainer(ABC):
-    conn: psycopg2.extensions.connection
+    conn: psycopg2.extensions.connection | None
+    pool: ConnectionPool
     
-    def __init__(self):
-        self.conn = psycopg2.connect(os.getenv("DATABASE_URL"))
+    def __init__(self, pool: ConnectionPool | None = None):
+        self.pool = pool or get_pool()
+        self.conn = self.pool.getconn()
+
+    def close(self):
+        if self.conn is not None:
+            self.pool.putconn(self.conn)
+            self.conn = None
+
+    def __getstate__(self):
+        # Pools and connections stay in the process that created them
+        state = self.__dict__.copy()
+        state["pool"] = None
+        state["conn"] = None
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     @abstractmethod
     def fetch_training_data(self):
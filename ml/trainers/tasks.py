@@ -0,0 +1,14 @@
+from .CombinedTrainer import CombinedTrainer
+
+# Module-level entry points so they can be pickled into worker processes
+
+def train_combined_model(save: bool = True) -> CombinedTrainer:
+    """Fetch, extract and train, then persist the artifact so the next start can skip training; the returned
+    trainer is detached from the database"""
+    with CombinedTrainer() as trainer:
+        trainer.fetch_training_data().extract_features().train()
+    if save:
+        trainer.save_model()
+    # Only the fitted artifacts travel back to the parent process
+    trainer.data = trainer.training_data = trainer.target = None
+    return trainer